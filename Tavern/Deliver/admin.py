@@ -1,10 +1,17 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from . import inventory, location_store, profiling, recommendations
 
 # Register your models here.
 from .models import *
 
 admin.site.register(Product)
-admin.site.register(Order)
 admin.site.register(ProductRating)
 admin.site.register(Promotion)
 @admin.register(Category)
@@ -28,4 +35,119 @@ class OrderTrackingAdmin(admin.ModelAdmin):
     list_display = ('order', 'status', 'driver_latitude', 'driver_longitude', 'updated_at')
     list_filter = ('status', 'updated_at')
     search_fields = ('order__id',)
-    readonly_fields = ('updated_at',)  # Updated automatically
\ No newline at end of file
+    readonly_fields = ('updated_at', 'route')  # Updated automatically
+
+    @admin.display(description='Route')
+    def route(self, obj):
+        url = reverse('driver_route', args=[obj.order_id])
+        return format_html('<a href="{}">Simplified route (JSON)</a>', url)
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+
+    def save_model(self, request, obj, form, change):
+        # Marking an order paid or delivered here settles it like a payment would
+        was_paid = change and form.initial.get('status') in recommendations.PAID_STATUSES
+        super().save_model(request, obj, form, change)
+        if obj.status in recommendations.PAID_STATUSES and not was_paid:
+            inventory.commit(obj.id)
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'state', 'received_at', 'processed_at', 'failed')
+    list_filter = ('state', 'processed_at')
+    search_fields = ('reference',)
+    readonly_fields = ('reference', 'state', 'payload', 'received_at', 'processed_at', 'error')
+
+    @admin.display(boolean=True)
+    def failed(self, obj):
+        return bool(obj.error)
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('order', 'product', 'quantity', 'state', 'expires_at')
+    list_filter = ('state',)
+    readonly_fields = ('order', 'product', 'quantity', 'state', 'expires_at')
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Profiled requests, slowest first, with their dumps for download:
+    .prof files open in snakeviz or 'python -m pstats'; .folded files in
+    speedscope or flamegraph.pl.
+    """
+    change_list_template = 'admin/Deliver/requestprofile/change_list.html'
+    list_display = ('path', 'view_name', 'status_code', 'duration_ms', 'query_count', 'db_ms',
+                    'trigger', 'created_at', 'downloads')
+    list_filter = ('trigger', 'view_name')
+    search_fields = ('path', 'view_name')
+    ordering = ('-duration_ms',)
+    exclude = ('pstats', 'collapsed')
+    readonly_fields = ('view_name', 'method', 'path', 'status_code', 'duration_ms', 'query_count',
+                       'db_ms', 'trigger', 'created_at', 'downloads', 'top_functions')
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('toggle/', self.admin_site.admin_view(self.toggle_view),
+                 name='Deliver_requestprofile_toggle'),
+            path('<int:pk>/download/<str:kind>/', self.admin_site.admin_view(self.download_view),
+                 name='Deliver_requestprofile_download'),
+        ]
+        return urls + super().get_urls()
+
+    @admin.display(description='Profile')
+    def downloads(self, obj):
+        if obj.pstats is not None:
+            kind, label = 'prof', 'pstats (.prof)'
+        elif obj.collapsed:
+            kind, label = 'folded', 'stacks (.folded)'
+        else:
+            return '-'
+        url = reverse('admin:Deliver_requestprofile_download', args=[obj.pk, kind])
+        return format_html('<a href="{}">{}</a>', url, label)
+
+    @admin.display(description='Top functions (cumulative)')
+    def top_functions(self, obj):
+        if obj.pstats is None:
+            return '-'
+        return format_html('<pre>{}</pre>', profiling.summary(bytes(obj.pstats)))
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'profiling_until': profiling.all_enabled_until()}
+        return super().changelist_view(request, extra_context)
+
+    def toggle_view(self, request):
+        if request.method != 'POST' or not self.has_change_permission(request):
+            raise PermissionDenied
+        if request.POST.get('enable'):
+            minutes = getattr(settings, 'PROFILE_TOGGLE_MINUTES', 10)
+            profiling.enable_all(minutes * 60)
+            self.message_user(request, f"Profiling every request for the next {minutes} minutes.")
+            if not location_store.cache_is_shared():
+                self.message_user(
+                    request,
+                    "The cache is not shared between worker processes, so only this one is profiling.",
+                    messages.WARNING,
+                )
+        else:
+            profiling.disable_all()
+            self.message_user(request, "Profiling every request is off.")
+        return redirect('admin:Deliver_requestprofile_changelist')
+
+    def download_view(self, request, pk, kind):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if kind == 'prof' and profile.pstats is not None:
+            response = HttpResponse(bytes(profile.pstats), content_type='application/octet-stream')
+        elif kind == 'folded' and profile.collapsed:
+            response = HttpResponse(profile.collapsed, content_type='text/plain; charset=utf-8')
+        else:
+            raise Http404("No such profile dump.")
+        response['Content-Disposition'] = f'attachment; filename="request-{profile.pk}.{kind}"'
+        return response
@@ -0,0 +1,322 @@
+# Deliver/benchmark.py
+import random
+import re
+import secrets
+import statistics
+import threading
+import time
+from collections import defaultdict
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .models import Cart, Category, Order, OrderTracking, Product, SubCategory
+from .search import get_backend as get_search_backend
+
+BENCH_PREFIX = 'bench-'
+
+
+# =========================
+# Fixtures
+# =========================
+def create_fixtures(products=200, categories=5, password=None):
+    """
+    A small catalog plus a customer with an order out for delivery. The
+    ids of every row made are kept under 'created' for remove_fixtures, and
+    checkouts use an email unique to this run, so the guest orders they
+    place can be told apart from anyone else's. The run adds the sessions
+    its drivers hold and the guest carts those sessions point at.
+    """
+    created = []
+    for c in range(categories):
+        category = Category.objects.create(name=f'Bench {c}', slug=f'{BENCH_PREFIX}{c}')
+        created.append((category, [
+            SubCategory.objects.create(category=category, name=f'Bench {c}.{s}', group_name='Bench',
+                                       slug=f'{BENCH_PREFIX}{c}-{s}')
+            for s in range(3)
+        ]))
+
+    words = ['red', 'white', 'dry', 'sweet', 'reserve', 'malt', 'lager', 'gin']
+    products = Product.objects.bulk_create([
+        Product(
+            name=f'Bench {words[n % len(words)]} {n}', slug=f'{BENCH_PREFIX}{n}',
+            description=f'{words[n % 3]} {words[n % 5]} bench product', price=500 + n,
+            stock=10 ** 6, image='products/bench.jpg',
+            category=created[n % categories][0], subcategory=created[n % categories][1][n % 3],
+            feature=('new', 'popular', None)[n % 3],
+        )
+        for n in range(products)
+    ])
+    get_search_backend().rebuild()  # bulk_create skips the index signals
+
+    user = User.objects.create(username=f'{BENCH_PREFIX}customer', email='bench@example.com')
+    if password:
+        user.set_password(password)
+        user.save(update_fields=['password'])
+    order = Order.objects.create(user=user, total_amount=1000, status='payment_initiated')
+    OrderTracking.objects.create(order=order, status='on_the_way')
+
+    category, subcategories = created[0]
+    return {
+        'category': category.slug,
+        'subcategory': subcategories[0].slug,
+        'products': [product.slug for product in products],
+        'search_terms': words,
+        'user': user,
+        'order_id': order.id,
+        'checkout_email': f'{BENCH_PREFIX}{secrets.token_hex(8)}@example.com',
+        'created': {
+            'orders': [order.id],
+            'users': [user.id],
+            'products': [product.id for product in products],
+            'categories': [category.id for category, _ in created],  # subcategories go with them
+            'sessions': set(),
+            'carts': set(),
+        },
+    }
+
+
+def remove_fixtures(fixtures):
+    """
+    Delete exactly what create_fixtures made, and the orders, guest carts
+    and sessions this run's requests made.
+    """
+    created = fixtures['created']
+    Cart.objects.filter(user=None, id__in=created['carts']).delete()
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    for session_key in created['sessions']:
+        store(session_key).delete()
+    Order.objects.filter(id__in=created['orders']).delete()
+    Order.objects.filter(email=fixtures['checkout_email']).delete()
+    User.objects.filter(id__in=created['users']).delete()
+    Product.objects.filter(id__in=created['products']).delete()
+    Category.objects.filter(id__in=created['categories']).delete()
+
+
+def remember_session(fixtures, session_key):
+    """
+    Note a driver's session and its guest cart. Checkout drops the cart from
+    the session, so this runs after every request rather than at the end.
+    """
+    created = fixtures['created']
+    created['sessions'].add(session_key)
+    cart_id = import_module(settings.SESSION_ENGINE).SessionStore(session_key).get('cart_id')
+    if cart_id:
+        created['carts'].add(cart_id)
+
+
+# =========================
+# Drivers
+# =========================
+class ClientDriver:
+    """
+    Requests through the Django test client, in this process. Counts the
+    queries each request runs.
+    """
+
+    def __init__(self, fixtures, logged_in=False):
+        self.client = Client()
+        if logged_in:
+            self.client.force_login(fixtures['user'])
+
+    def request(self, method, path, data=None, json_body=None):
+        kwargs = {}
+        if json_body is not None:
+            data, kwargs['content_type'] = json_body, 'application/json'
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data or {}, **kwargs)
+        return response.status_code, len(queries)
+
+    def session_key(self):
+        cookie = self.client.cookies.get(settings.SESSION_COOKIE_NAME)
+        return cookie.value if cookie else None
+
+    def close(self):
+        connection.close()
+
+
+SERVER_TIMING_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+class HttpDriver:
+    """
+    Requests to a running server (e.g. 'manage.py runserver' or uvicorn).
+    Query counts are read from the Server-Timing header that
+    QueryStatsMiddleware adds; they are left out unless the server runs with
+    DEBUG, since the header is otherwise only sent to staff.
+    """
+
+    def __init__(self, base_url, fixtures, logged_in=False, password=None):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.session.get(self.base_url + '/login/')  # sets the CSRF cookie
+        if logged_in:
+            self.request('post', '/login/', {
+                'username_or_email': fixtures['user'].username, 'password': password,
+            })
+
+    def request(self, method, path, data=None, json_body=None):
+        headers = {'X-CSRFToken': self.session.cookies.get('csrftoken', '')}
+        response = self.session.request(
+            method.upper(), self.base_url + path, data=data, json=json_body,
+            headers=headers, allow_redirects=False, timeout=30,
+        )
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        return response.status_code, int(match.group(1)) if match else None
+
+    def session_key(self):
+        return self.session.cookies.get(settings.SESSION_COOKIE_NAME)
+
+    def close(self):
+        self.session.close()
+
+
+# =========================
+# Scenarios
+# =========================
+# Each step is (endpoint label, method, path, form data, JSON body).
+
+def browse(f, rng):
+    yield 'home', 'get', '/', None, None
+    yield 'category', 'get', f"/category/{f['category']}/", None, None
+    yield 'subcategory', 'get', f"/category/{f['category']}/{f['subcategory']}/", None, None
+
+
+def search(f, rng):
+    yield 'search', 'get', '/', {'q': rng.choice(f['search_terms'])}, None
+
+
+def product_detail(f, rng):
+    yield 'product_detail', 'get', f"/product/{rng.choice(f['products'])}/", None, None
+
+
+def add_to_cart(f, rng):
+    yield 'add_to_cart', 'post', f"/add-to-cart/{rng.choice(f['products'])}/", None, None
+
+
+def checkout(f, rng):
+    yield 'add_to_cart', 'post', f"/add-to-cart/{rng.choice(f['products'])}/", None, None
+    yield 'cart', 'get', '/cart/', None, None
+    yield 'checkout', 'post', '/checkout/', {
+        'first_name': 'Bench', 'last_name': 'Customer', 'phone': '0700000000',
+        'email': f['checkout_email'], 'building_name': 'Bench House', 'payment': 'cod',
+    }, None
+
+
+def poll_payment(f, rng):
+    yield 'payment_status', 'get', f"/checkout/intasend/status/{f['order_id']}/", None, None
+
+
+def driver_ping(f, rng):
+    yield 'driver_ping', 'post', f"/update-location/{f['order_id']}/", None, {
+        'latitude': round(-1.28 + rng.uniform(-0.01, 0.01), 6),
+        'longitude': round(36.82 + rng.uniform(-0.01, 0.01), 6),
+        'status': 'on_the_way',
+    }
+
+
+def track_order(f, rng):
+    yield 'track_order', 'get', f"/track/{f['order_id']}/", None, None
+
+
+SCENARIOS = {
+    'browse': browse,
+    'search': search,
+    'product_detail': product_detail,
+    'add_to_cart': add_to_cart,
+    'checkout': checkout,
+    'poll_payment': poll_payment,
+    'driver_ping': driver_ping,
+    'track_order': track_order,
+}
+# Scenarios that need the customer to be signed in
+SIGNED_IN = {'track_order'}
+
+
+# =========================
+# Runner
+# =========================
+def run(scenarios, fixtures, make_driver, workers=4, iterations=10, seed=0):
+    """
+    Run every scenario `iterations` times on each of `workers` threads.
+    Each worker has its own session (so its own cart) and shuffles the
+    scenario order every round. Returns the report as a dict.
+    """
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    start = threading.Barrier(workers)
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        drivers = {False: make_driver(logged_in=False), True: make_driver(logged_in=True)}
+        mine = defaultdict(list)
+        start.wait()
+        try:
+            for _ in range(iterations):
+                for name in rng.sample(scenarios, len(scenarios)):
+                    driver = drivers[name in SIGNED_IN]
+                    for label, method, path, data, json_body in SCENARIOS[name](fixtures, rng):
+                        began = time.perf_counter()
+                        try:
+                            status, queries = driver.request(method, path, data, json_body)
+                        except Exception:
+                            status, queries = None, None
+                        mine[label].append((time.perf_counter() - began, status, queries))
+                        session_key = driver.session_key()
+                        if session_key:
+                            remember_session(fixtures, session_key)
+        finally:
+            for driver in drivers.values():
+                driver.close()
+            with lock:
+                for label, rows in mine.items():
+                    samples[label].extend(rows)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - began
+
+    total = sum(len(rows) for rows in samples.values())
+    return {
+        'workers': workers,
+        'iterations': iterations,
+        'scenarios': list(scenarios),
+        'duration_s': round(duration, 3),
+        'requests': total,
+        'throughput_rps': round(total / duration, 1) if duration else None,
+        'endpoints': {label: summarize(rows, duration) for label, rows in sorted(samples.items())},
+    }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(rows, duration):
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in rows)
+    queries = [q for _, _, q in rows if q is not None]
+    errors = sum(1 for _, status, _ in rows if status is None or status >= 500)
+    return {
+        'requests': len(rows),
+        'errors': errors,
+        'throughput_rps': round(len(rows) / duration, 1) if duration else None,
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries_mean': round(statistics.fmean(queries), 1) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
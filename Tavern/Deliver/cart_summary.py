@@ -0,0 +1,142 @@
+# Deliver/cart_summary.py
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+
+from . import metrics
+from .models import Cart, CartItem
+
+VAT_RATE = Decimal('0.16')
+DELIVERY_THRESHOLD = Decimal('15000')
+
+
+def summary_timeout():
+    return getattr(settings, 'CART_SUMMARY_TIMEOUT', 60 * 60)
+
+
+def summary_key(cart_id):
+    return f'cart:summary:{cart_id}'
+
+
+def summary_version_key(cart_id):
+    return f'cart:summary:version:{cart_id}'
+
+
+def user_cart_key(user_id):
+    return f'cart:user:{user_id}'
+
+
+def user_cart_version_key(user_id):
+    return f'cart:user:version:{user_id}'
+
+
+# =========================
+# Building a summary
+# =========================
+def build_summary(total=Decimal('0'), item_count=0, line_count=0):
+    total = Decimal(total)
+    subtotal_ex_vat = (total / (Decimal('1') + VAT_RATE)) if total > 0 else Decimal('0')
+    progress_percent = (total / DELIVERY_THRESHOLD * Decimal('100')) if total > 0 else Decimal('0')
+
+    return {
+        'item_count': item_count,
+        'line_count': line_count,
+        'total': total,
+        'subtotal_ex_vat': subtotal_ex_vat,
+        'vat_amount': total - subtotal_ex_vat,
+        'progress_percent': min(progress_percent, Decimal('100')),
+        'delivery_threshold': DELIVERY_THRESHOLD,
+    }
+
+
+EMPTY_SUMMARY = build_summary()
+
+
+def compute_summary(cart_id):
+    """
+    Totals for a cart from a single aggregate query.
+    """
+    totals = CartItem.objects.filter(cart_id=cart_id).aggregate(
+        total=Sum(F('product__price') * F('quantity')),
+        item_count=Sum('quantity'),
+        line_count=Count('id'),
+    )
+    return build_summary(
+        totals['total'] or Decimal('0'),
+        totals['item_count'] or 0,
+        totals['line_count'],
+    )
+
+
+# =========================
+# Versioned entries
+# =========================
+# Each entry is stored as (version, value) next to a version counter that
+# invalidation bumps. A value computed while an invalidation lands is stored
+# under the version read before computing, so it is never served afterwards.
+def get_versioned(key, version_key):
+    found = cache.get_many([key, version_key])
+    version = found.get(version_key)
+    if version is None:
+        # Seed from the clock so an evicted key never reuses an old version
+        cache.add(version_key, int(time.time() * 1000), None)
+        version = cache.get(version_key)
+    entry = found.get(key)
+    if entry is not None and entry[0] == version:
+        return version, entry[1]
+    return version, None
+
+
+def bump_version(version_key):
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, int(time.time() * 1000), None)
+
+
+# =========================
+# Cached access
+# =========================
+def get_cart_summary(cart_id):
+    version, summary = get_versioned(summary_key(cart_id), summary_version_key(cart_id))
+    metrics.cache_lookup('cart_summary', summary is not None)
+    if summary is None:
+        summary = compute_summary(cart_id)
+        cache.set(summary_key(cart_id), (version, summary), summary_timeout())
+    return summary
+
+
+def invalidate_cart_summary(*cart_ids):
+    for cart_id in set(cart_ids):
+        bump_version(summary_version_key(cart_id))
+
+
+def invalidate_user_cart(user_id):
+    bump_version(user_cart_version_key(user_id))
+
+
+def get_request_cart_id(request):
+    """
+    The id of the request's cart, or None. Unlike views.get_cart this never
+    creates a cart, and for signed-in users the lookup is cached.
+    """
+    if request.user.is_authenticated:
+        user_id = request.user.id
+        version, cart_id = get_versioned(user_cart_key(user_id), user_cart_version_key(user_id))
+        if cart_id is None:
+            cart_id = Cart.objects.filter(user_id=user_id).values_list('id', flat=True).first()
+            if cart_id is None:
+                return None
+            cache.set(user_cart_key(user_id), (version, cart_id), summary_timeout())
+        return cart_id
+    return request.session.get('cart_id')
+
+
+def get_request_summary(request):
+    cart_id = get_request_cart_id(request)
+    if cart_id is None:
+        return EMPTY_SUMMARY
+    return get_cart_summary(cart_id)
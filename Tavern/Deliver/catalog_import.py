@@ -0,0 +1,265 @@
+# Deliver/catalog_import.py
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import cart_summary, navigation, page_cache
+from .models import CartItem, Category, Product, SubCategory
+from .search import get_backend as get_search_backend
+
+# Input columns that map straight onto Product fields
+TEXT_FIELDS = ('description', 'size', 'country', 'image', 'accolades')
+SLUG_LENGTH = Product._meta.get_field('slug').max_length
+MAX_STOCK = 2 ** 31 - 1  # PositiveIntegerField's range on every backend
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+# =========================
+# Reading
+# =========================
+def read_rows(stream, fmt):
+    """
+    Yield (line number, record) from a CSV (header row first) or JSON-lines
+    stream, one at a time, so the input can be any size.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, {key.strip(): value for key, value in record.items() if key}
+    elif fmt == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None  # reported as a bad row
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def unique_slug(base, taken):
+    """`base`, or `base-2`, `base-3`, ... whichever is not in `taken` (kept within the column size)."""
+    base = base[:SLUG_LENGTH] or 'item'
+    slug, n = base, 1
+    while slug in taken:
+        n += 1
+        suffix = f'-{n}'
+        slug = base[:SLUG_LENGTH - len(suffix)] + suffix
+    return slug
+
+
+def decimal_or_none(value, column):
+    """`value` as a Decimal that fits the Product `column`, or None for empty."""
+    if value is None or value == '':
+        return None
+    field = Product._meta.get_field(column)
+    try:
+        if isinstance(value, bool):
+            raise InvalidOperation
+        number = Decimal(str(value).strip())
+        if not number.is_finite():
+            raise InvalidOperation
+        number = number.quantize(Decimal(1).scaleb(-field.decimal_places))
+    except InvalidOperation:
+        raise ImportRowError(f"{column} is not a number: {value!r}")
+    if abs(number) >= 10 ** (field.max_digits - field.decimal_places):
+        raise ImportRowError(f"{column} is out of range: {value!r}")
+    return number
+
+
+def text(value, column):
+    """`value` as a string that fits the Product `column`."""
+    value = str(value).strip()
+    max_length = Product._meta.get_field(column).max_length
+    if max_length and len(value) > max_length:
+        raise ImportRowError(f"{column} is longer than {max_length} characters")
+    return value
+
+
+# =========================
+# Importing
+# =========================
+class CatalogImporter:
+    """
+    Upserts products keyed on slug, `batch_size` rows per INSERT ... ON
+    CONFLICT statement. Categories and subcategories are looked up in maps
+    loaded once (by name or slug) and created on first sight.
+
+    A row's slug comes from its `slug` column, or else from its name. A
+    name only updates the product already holding its slug if the names
+    match (ignoring case); a different name that slugifies alike, in the
+    file or in the database, gets `-2`, `-3`, ... Give a `slug` column when
+    product names may change between imports.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.categories = {}
+        for category in Category.objects.all():
+            self.categories[category.slug] = category.id
+            self.categories[category.name.lower()] = category.id
+        self.category_slugs = set(Category.objects.values_list('slug', flat=True))
+        self.subcategories = {
+            (category_id, name.lower()): id
+            for id, category_id, name in SubCategory.objects.values_list('id', 'category_id', 'name')
+        }
+        self.subcategory_slugs = set(SubCategory.objects.values_list('slug', flat=True))
+        # slug -> the (lower-cased) name of the product holding it, in the
+        # database or earlier in this import
+        self.slug_owners = {
+            slug: name.lower() for slug, name in Product.objects.values_list('slug', 'name').iterator()
+        }
+        self.created_categories = 0
+        self.imported = 0
+        self.errors = []
+
+    # ---- lookups ----
+    def category_id(self, name):
+        key = name.strip().lower()
+        if key not in self.categories:
+            slug = unique_slug(slugify(name), self.category_slugs)
+            category = Category.objects.create(name=name.strip(), slug=slug)
+            self.category_slugs.add(slug)
+            self.categories[key] = self.categories[slug] = category.id
+            self.created_categories += 1
+        return self.categories[key]
+
+    def subcategory_id(self, category_id, name, group):
+        key = (category_id, name.strip().lower())
+        if key not in self.subcategories:
+            slug = unique_slug(slugify(name), self.subcategory_slugs)
+            subcategory = SubCategory.objects.create(
+                category_id=category_id, name=name.strip(), group_name=group or None, slug=slug,
+            )
+            self.subcategory_slugs.add(slug)
+            self.subcategories[key] = subcategory.id
+            self.created_categories += 1
+        return self.subcategories[key]
+
+    def product_slug(self, record, name):
+        owner = name.lower()
+        slug = slugify(str(record.get('slug') or ''))[:SLUG_LENGTH]
+        if slug:
+            self.slug_owners.setdefault(slug, owner)
+            return slug
+        base = slugify(name)[:SLUG_LENGTH] or 'item'
+        slug, n = base, 1
+        # Claims the slug for this name, unless another name has it
+        while self.slug_owners.setdefault(slug, owner) != owner:
+            n += 1
+            suffix = f'-{n}'
+            slug = base[:SLUG_LENGTH - len(suffix)] + suffix
+        return slug
+
+    # ---- rows ----
+    def to_product(self, record):
+        if not isinstance(record, dict):
+            raise ImportRowError("not a JSON object")
+        for column, value in record.items():
+            if isinstance(value, (dict, list)):
+                raise ImportRowError(f"{column} must be a single value, not {type(value).__name__}")
+        name = text(record.get('name') or '', 'name')
+        if not name:
+            raise ImportRowError("name is required")
+        price = decimal_or_none(record.get('price'), 'price')
+        if price is None:
+            raise ImportRowError("price is required")
+
+        product = Product(name=name, slug=self.product_slug(record, name), price=price)
+        fields = {'name', 'price'}
+        if 'old_price' in record:
+            product.old_price = decimal_or_none(record['old_price'], 'old_price')
+            fields.add('old_price')
+        if 'stock' in record:
+            try:
+                product.stock = int(record['stock'] or 0)
+            except (TypeError, ValueError):
+                product.stock = -1
+            if not 0 <= product.stock <= MAX_STOCK:
+                raise ImportRowError(f"stock is not a whole number up to {MAX_STOCK}: {record['stock']!r}")
+            fields.add('stock')
+        if record.get('feature'):
+            if record['feature'] not in dict(Product.FEATURE_CHOICES):
+                raise ImportRowError(f"unknown feature: {record['feature']!r}")
+            product.feature = record['feature']
+            fields.add('feature')
+        for column in TEXT_FIELDS:
+            if column in record:
+                field = Product._meta.get_field(column)
+                value = record[column]
+                setattr(product, column, text(value, column) if value not in (None, '')
+                        else None if field.null else field.get_default())
+                fields.add(column)
+        if record.get('category'):
+            product.category_id = self.category_id(str(record['category']))
+            fields.add('category')
+            if record.get('subcategory'):
+                group = record.get('group')
+                product.subcategory_id = self.subcategory_id(
+                    product.category_id, str(record['subcategory']), str(group) if group else None,
+                )
+                fields.add('subcategory')
+        return product, frozenset(fields)
+
+    def run(self, rows, progress=None):
+        """
+        Import (line number, record) pairs; calls progress(imported, seconds)
+        after each batch. Returns the number of rows imported.
+        """
+        started = time.perf_counter()
+        batch = {}
+        try:
+            for number, record in rows:
+                try:
+                    product, fields = self.to_product(record)
+                except ImportRowError as exc:
+                    self.errors.append((number, str(exc)))
+                    continue
+                batch[product.slug] = (product, fields)  # a later row for the same slug wins
+                if len(batch) >= self.batch_size:
+                    self.write(batch.values())
+                    batch = {}
+                    if progress:
+                        progress(self.imported, time.perf_counter() - started)
+            if batch:
+                self.write(batch.values())
+        finally:
+            # Batches already written are committed, so even an import cut
+            # short must be made visible to search and the caches
+            self.finish()
+        return self.imported
+
+    def write(self, rows):
+        # Rows naming different columns go in separate statements, so a
+        # column a row leaves out is never overwritten with a default
+        by_fields = {}
+        for product, fields in rows:
+            by_fields.setdefault(fields, []).append(product)
+        with transaction.atomic():
+            for fields, products in by_fields.items():
+                Product.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=sorted(fields),
+                )
+                slugs = [product.slug for product in products]
+                # Prices may have changed under carts holding these products
+                cart_summary.invalidate_cart_summary(*set(
+                    CartItem.objects.filter(product__slug__in=slugs).values_list('cart_id', flat=True)
+                ))
+                self.imported += len(products)
+
+    def finish(self):
+        # bulk_create skips the signals that keep these in step
+        get_search_backend().rebuild()
+        page_cache.bump_catalog_version()
+        if self.created_categories:
+            navigation.bump_nav_version()
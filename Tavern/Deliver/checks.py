@@ -0,0 +1,30 @@
+# Deliver/checks.py
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from . import location_store
+
+
+@register(Tags.caches)
+def check_driver_location_cache(app_configs, **kwargs):
+    if getattr(settings, 'DRIVER_LOCATION_WRITE_BEHIND', None) and not location_store.cache_is_shared():
+        return [Warning(
+            "DRIVER_LOCATION_WRITE_BEHIND is on but the default cache is per process.",
+            hint="Unflushed driver pings would be stranded in one worker. Set REDIS_URL "
+                 "or leave DRIVER_LOCATION_WRITE_BEHIND unset.",
+            id='Deliver.W001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if not location_store.cache_is_shared():
+        return [Warning(
+            "The default cache is per process.",
+            hint="Driver pings are written through to the database on every change, cache "
+                 "invalidations and the admin's profiling toggle reach only one worker. "
+                 "Set REDIS_URL.",
+            id='Deliver.W002',
+        )]
+    return []
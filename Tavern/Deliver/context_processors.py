@@ -1,32 +1,21 @@
-from .models import Category, SubCategory
-from django.db.models import Prefetch
 # Deliver/context_processors.py
-from decimal import Decimal
-from .models import Cart, CartItem
+from django.utils.functional import SimpleLazyObject
+from . import cart_summary, navigation
 
 def cart_total_processor(request):
-    total = Decimal('0.00')
-    cart = None
-
-    if request.user.is_authenticated:
-        cart = Cart.objects.filter(user=request.user).first()
-    else:
-        cart_id = request.session.get('cart_id')
-        if cart_id:
-            cart = Cart.objects.filter(id=cart_id).first()
-
-    if cart:
-        total = sum(Decimal(item.total_price()) for item in cart.items.all())
-
-    return {'cart_total': total}
+    # Cached per cart and refreshed only when the cart changes
+    summary = cart_summary.get_request_summary(request)
+    return {
+        'cart_total': summary['total'],
+        'cart_item_count': summary['item_count'],
+    }
 
 def categories_processor(request):
-    categories = Category.objects.prefetch_related(
-        Prefetch(
-            'subcategories',
-            queryset=SubCategory.objects.order_by('group_name', 'name')
-        )
-    )
+    # The rendered mega-menu is fragment-cached under nav_version, so the
+    # tree is only built (and cached) when that fragment is missing.
+    version = navigation.get_nav_version()
     return {
-        'nav_categories': categories
-    }
\ No newline at end of file
+        'nav_categories': SimpleLazyObject(lambda: navigation.get_nav_tree(version)),
+        'nav_version': version,
+        'nav_cache_timeout': navigation.nav_cache_timeout(),
+    }
@@ -0,0 +1,114 @@
+# Deliver/exports.py
+import csv
+import json
+import re
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Order
+
+# One row per order line; orders without lines still get one row
+COLUMNS = (
+    ('order_id', 'id'),
+    ('created_at', 'created_at'),
+    ('status', 'status'),
+    ('total_amount', 'total_amount'),
+    ('username', 'user__username'),
+    ('account_email', 'user__email'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('phone', 'phone'),
+    ('email', 'email'),
+    ('building_name', 'building_name'),
+    ('door_number', 'door_number'),
+    ('latitude', 'latitude'),
+    ('longitude', 'longitude'),
+    ('product_id', 'items__product_id'),
+    ('product_name', 'items__product__name'),
+    ('quantity', 'items__quantity'),
+    ('unit_price', 'items__price'),
+)
+HEADER = [name for name, _ in COLUMNS]
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# ...but a leading + or - on a number or phone number like "+254 700 000000"
+# can only ever be arithmetic, and prefixing it would corrupt the value
+NUMBER_LIKE = re.compile(r'[+-][\d\s().-]*\d[\d\s().-]*')
+
+
+def parse_date(value):
+    """A YYYY-MM-DD string as a date, None for empty; ValueError otherwise."""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def order_rows(start=None, end=None, statuses=()):
+    """
+    Tuples in COLUMNS order for orders created between the `start` and
+    `end` dates (inclusive, in the site time zone), fetched in chunks
+    through a server-side cursor where the database has them, so memory
+    stays flat however many orders match.
+    """
+    orders = Order.objects.all()
+    if start:
+        orders = orders.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        next_day = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        orders = orders.filter(created_at__lt=next_day)
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+    return (
+        orders.order_by('id', 'items__id')
+        .values_list(*(lookup for _, lookup in COLUMNS))
+        .iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+    )
+
+
+class Echo:
+    """A file-like object csv.writer can write to, handing each line back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    # Customer-typed text like "=HYPERLINK(...)" must stay text when opened
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) and not NUMBER_LIKE.fullmatch(value):
+        return "'" + value
+    return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(HEADER, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def lines(fmt, rows):
+    return csv_lines(rows) if fmt == 'csv' else ndjson_lines(rows)
+
+
+async def achunks(lines, size=None):
+    """
+    The sync `lines` for an ASGI response, `size` lines (EXPORT_CHUNK_SIZE)
+    at a time, each batch read on Django's sync thread. Handing ASGI a sync
+    iterator would make it read the whole export into memory first.
+    """
+    size = size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    take = sync_to_async(lambda: ''.join(islice(lines, size)))
+    while chunk := await take():
+        yield chunk
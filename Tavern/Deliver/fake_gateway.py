@@ -0,0 +1,88 @@
+# Deliver/fake_gateway.py
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# =========================
+# Local IntaSend stand-in
+# =========================
+class FakeIntaSendGateway:
+    """
+    A tiny local HTTP server answering like IntaSend's STK push endpoint,
+    for tests and benchmarks. Queue scripted responses with `respond()`;
+    once the queue is empty every request gets `default` after `delay`.
+
+        with FakeIntaSendGateway() as gateway:
+            client = IntaSendClient('key', gateway.url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0):
+        self.delay = delay
+        self.default = (201, {"invoice": {"state": "PENDING"}})
+        self.requests = []
+        self._script = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/v1/'
+
+    def respond(self, status, body=None, delay=None, headers=None):
+        with self._lock:
+            self._script.append((status, {} if body is None else body, delay, headers or {}))
+
+    def _next(self):
+        with self._lock:
+            if self._script:
+                return self._script.popleft()
+        return self.default[0], self.default[1], None, {}
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                with gateway._lock:
+                    gateway.requests.append((self.path, json.loads(body or b'{}')))
+                status, payload, delay, headers = gateway._next()
+                time.sleep(gateway.delay if delay is None else delay)
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+                except ConnectionError:
+                    self.close_connection = True  # the client timed out and hung up
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
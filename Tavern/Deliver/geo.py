@@ -0,0 +1,158 @@
+# Deliver/geo.py
+import math
+
+SCALE = 1_000_000  # coordinates are stored as integer micro-degrees
+EARTH_RADIUS_M = 6_371_000
+
+
+# =========================
+# Compact point encoding
+# =========================
+# A chunk is a run of (t_ms, lat_e6, lng_e6) points. Each point is stored as
+# the difference from the previous one (the first from (start_ms, 0, 0)),
+# zigzag-mapped and written as a varint, so a point of a moving vehicle
+# pinging every few seconds costs ~6-8 bytes instead of a database row.
+
+def to_e6(value):
+    return int(round(float(value) * SCALE))
+
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)  # zigzag: small negatives stay small
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    shift = result = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), pos
+
+
+def encode_points(points, start_ms):
+    out = bytearray()
+    prev = (start_ms, 0, 0)
+    for point in points:
+        for value, before in zip(point, prev):
+            _write_varint(out, value - before)
+        prev = point
+    return bytes(out)
+
+
+def decode_points(data, start_ms):
+    data = bytes(data)
+    points = []
+    prev = (start_ms, 0, 0)
+    pos = 0
+    while pos < len(data):
+        t, pos = _read_varint(data, pos)
+        lat, pos = _read_varint(data, pos)
+        lng, pos = _read_varint(data, pos)
+        prev = (prev[0] + t, prev[1] + lat, prev[2] + lng)
+        points.append(prev)
+    return points
+
+
+# =========================
+# Distances
+# =========================
+def _to_xy(point, ref_lat):
+    # Equirectangular projection in metres; accurate at city scale
+    lat = math.radians(point[1] / SCALE)
+    lng = math.radians(point[2] / SCALE)
+    return lng * math.cos(ref_lat) * EARTH_RADIUS_M, lat * EARTH_RADIUS_M
+
+
+def haversine_m(a, b):
+    lat1, lng1 = math.radians(a[1] / SCALE), math.radians(a[2] / SCALE)
+    lat2, lng2 = math.radians(b[1] / SCALE), math.radians(b[2] / SCALE)
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def path_length_m(points):
+    return sum(haversine_m(a, b) for a, b in zip(points, points[1:]))
+
+
+# =========================
+# Downsampling
+# =========================
+def time_bucket(points, seconds):
+    """
+    Keep the last point of every `seconds`-long window (plus the first point).
+    """
+    if seconds <= 0 or len(points) < 3:
+        return list(points)
+    width = seconds * 1000
+    kept = [points[0]]
+    for current, following in zip(points[1:], points[2:]):
+        if current[0] // width != following[0] // width:
+            kept.append(current)
+    kept.append(points[-1])
+    return kept
+
+
+def douglas_peucker(points, tolerance_m):
+    """
+    Drop points closer than `tolerance_m` metres to the simplified line.
+    Iterative, so long routes cannot hit the recursion limit.
+    """
+    if tolerance_m <= 0 or len(points) < 3:
+        return list(points)
+
+    ref_lat = math.radians(sum(p[1] for p in points) / len(points) / SCALE)
+    xy = [_to_xy(point, ref_lat) for point in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        worst, worst_index = 0.0, None
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            if length:
+                distance = abs(dy * x - dx * y + x2 * y1 - y2 * x1) / length
+            else:
+                distance = math.hypot(x - x1, y - y1)
+            if distance > worst:
+                worst, worst_index = distance, i
+        if worst_index is not None and worst > tolerance_m:
+            keep[worst_index] = True
+            stack.append((first, worst_index))
+            stack.append((worst_index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+# =========================
+# Output
+# =========================
+def encode_polyline(points):
+    """
+    Google encoded polyline (precision 5) of (t, lat_e6, lng_e6) points.
+    """
+    out = []
+    prev_lat = prev_lng = 0
+    for _, lat_e6, lng_e6 in points:
+        lat, lng = round(lat_e6 / 10), round(lng_e6 / 10)
+        for delta in (lat - prev_lat, lng - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lng = lat, lng
+    return ''.join(out)
@@ -0,0 +1,226 @@
+# Deliver/intasend.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class IntaSendError(Exception):
+    pass
+
+
+class CircuitOpenError(IntaSendError):
+    pass
+
+
+# =========================
+# Circuit breaker
+# =========================
+class CircuitBreaker:
+    """
+    After `failure_threshold` consecutive gateway failures, fail fast for
+    `reset_timeout` seconds instead of tying up workers on a dead gateway.
+    Then let a single trial request through (half-open).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+# =========================
+# Client
+# =========================
+class GatewayResponse:
+
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    @property
+    def ok(self):
+        return self.status_code in (200, 201, 202)
+
+    @property
+    def error(self):
+        default = "Request failed. Verify your phone number."
+        if not isinstance(self.data, dict):
+            return default
+        return self.data.get("errors", default)
+
+
+class CappedRetry(Retry):
+    """
+    Retry that honours a 503's Retry-After, but never sleeps longer than
+    `max_retry_after` seconds: a worker is held for the whole wait.
+    """
+
+    def __init__(self, *args, max_retry_after=3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.max_retry_after)
+
+
+class IntaSendClient:
+    """
+    IntaSend API client sharing one pooled keep-alive session per process.
+
+    Only failures where the gateway cannot have acted (connection errors,
+    503) are retried, with exponential backoff or the gateway's Retry-After
+    (capped at `max_retry_after`). A read timeout or a 502 is not: the STK
+    prompt may already be on the customer's phone.
+    """
+
+    def __init__(self, secret_key, base_url, timeout=(3.05, 10), retries=2,
+                 backoff=0.3, pool_size=10, breaker=None, max_retry_after=3):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+
+        retry = CappedRetry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            status_forcelist=(503,),
+            allowed_methods=None,  # POST included: see the note above
+            backoff_factor=backoff,
+            raise_on_status=False,
+            max_retry_after=max_retry_after,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {secret_key}",
+            "Content-Type": "application/json",
+        })
+
+    def post(self, path, payload):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Payment gateway is unavailable, please try again shortly.")
+        try:
+            response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        except requests.RequestException as exc:
+            self.breaker.record_failure()
+            raise IntaSendError(str(exc)) from exc
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        return GatewayResponse(response.status_code, data)
+
+    def stk_push(self, amount, phone_number, api_ref, callback_url, currency="KES"):
+        return self.post("payment/mpesa-stk-push/", {
+            "amount": float(amount),
+            "phone_number": phone_number,
+            "currency": currency,
+            "api_ref": api_ref,
+            "callback_url": callback_url,
+        })
+
+    async def astk_push(self, *args, **kwargs):
+        """
+        stk_push for async (ASGI) views. There is no async HTTP client here,
+        so this is still the blocking call, run on a small dedicated pool:
+        the event loop keeps going while the gateway answers, and a slow
+        gateway holds at most INTASEND_ASYNC_WORKERS threads. Further pushes
+        wait in the pool's queue rather than spawning more threads.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), partial(self.stk_push, *args, **kwargs))
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = IntaSendClient(
+                settings.INTASEND_SECRET_KEY,
+                settings.INTASEND_API_URL,
+                timeout=settings.INTASEND_TIMEOUT,
+                retries=settings.INTASEND_RETRIES,
+                max_retry_after=getattr(settings, 'INTASEND_MAX_RETRY_AFTER', 3),
+                breaker=CircuitBreaker(
+                    settings.INTASEND_BREAKER_THRESHOLD,
+                    settings.INTASEND_BREAKER_RESET,
+                ),
+            )
+        return _client
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'INTASEND_ASYNC_WORKERS', 10),
+                thread_name_prefix='intasend',
+            )
+        return _executor
@@ -0,0 +1,135 @@
+# Deliver/inventory.py
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import page_cache, recommendations
+from .models import Product, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class OutOfStockError(Exception):
+
+    def __init__(self, products):
+        super().__init__(', '.join(product.name for product in products))
+        self.products = products
+
+
+def reservation_ttl():
+    return getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60)
+
+
+def line_quantities(lines):
+    quantities = defaultdict(int)
+    for line in lines:
+        quantities[line.product_id] += line.quantity
+    return dict(quantities)
+
+
+# =========================
+# Reserving
+# =========================
+def reserve(order, quantities, hold=True):
+    """
+    Take `quantities` ({product_id: qty}) off stock for `order`, all or
+    nothing. One conditional UPDATE ... WHERE stock >= qty covers every
+    line, so concurrent checkouts can never drive stock below zero; if any
+    line is short the decrement is rolled back and OutOfStockError names
+    the products that could not be supplied.
+
+    With `hold` the stock is held until payment and returned if the hold
+    expires first; without it (orders not paid online) it is sold at once.
+    """
+    needed = Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        taken = Product.objects.filter(id__in=quantities, stock__gte=needed).update(
+            stock=F('stock') - needed
+        )
+        if taken != len(quantities):
+            transaction.set_rollback(True)
+    if taken != len(quantities):
+        raise OutOfStockError(shortages(quantities))
+
+    if Product.objects.filter(id__in=quantities, stock=0).exists():
+        # Cached catalog pages still say "In stock"
+        transaction.on_commit(page_cache.bump_catalog_version)
+
+    expires_at = timezone.now() + timedelta(seconds=reservation_ttl())
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at,
+                         state='held' if hold else 'committed')
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def shortages(quantities):
+    return [
+        product for product in Product.objects.filter(id__in=quantities).only('id', 'name', 'stock')
+        if product.stock < quantities[product.id]
+    ]
+
+
+# =========================
+# Settling
+# =========================
+def commit(order_id):
+    """
+    The order is paid: its held stock is sold. Holds that had already
+    lapsed are taken again if the stock is still there. The order's
+    co-purchases are counted the first time its stock is sold; orders not
+    paid online were sold, and counted, when placed.
+    """
+    with transaction.atomic():
+        committed = StockReservation.objects.filter(order_id=order_id, state='held').update(state='committed')
+
+        for reservation in StockReservation.objects.filter(order_id=order_id, state='released'):
+            if not StockReservation.objects.filter(id=reservation.id, state='released').update(state='committed'):
+                continue
+            committed += 1
+            taken = Product.objects.filter(id=reservation.product_id, stock__gte=reservation.quantity).update(
+                stock=F('stock') - reservation.quantity
+            )
+            if not taken:
+                logger.warning(
+                    "Order #%s was paid after its hold on product %s lapsed, and the stock has since sold",
+                    order_id, reservation.product_id,
+                )
+
+        # Orders from before stock reservations have nothing to commit
+        if committed or not StockReservation.objects.filter(order_id=order_id).exists():
+            recommendations.record_order(order_id)
+
+
+def release(reservations):
+    """
+    Hand held stock back to the products. Each hold is claimed with a
+    conditional UPDATE first, so racing releases return it only once.
+    """
+    released = 0
+    with transaction.atomic():
+        for reservation in reservations:
+            if StockReservation.objects.filter(id=reservation.id, state='held').update(state='released'):
+                Product.objects.filter(id=reservation.product_id).update(
+                    stock=F('stock') + reservation.quantity
+                )
+                released += 1
+        if released:
+            transaction.on_commit(page_cache.bump_catalog_version)
+    return released
+
+
+def release_order(order_id):
+    return release(StockReservation.objects.filter(order_id=order_id, state='held'))
+
+
+def release_expired():
+    return release(StockReservation.objects.filter(state='held', expires_at__lt=timezone.now()))
@@ -0,0 +1,245 @@
+# Deliver/location_store.py
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+from . import geo
+from .models import LocationTrackChunk, Order, OrderTracking
+
+COORDINATE = Decimal('0.000001')
+
+
+def flush_interval():
+    return getattr(settings, 'DRIVER_LOCATION_FLUSH_INTERVAL', 30)
+
+
+def entry_timeout():
+    return getattr(settings, 'DRIVER_LOCATION_TTL', 60 * 60 * 6)
+
+
+def cache_is_shared():
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def write_behind():
+    """
+    Whether pings may wait in the cache for a later flush. Only safe when
+    every process shares the cache: in a per-process cache, unflushed pings
+    are stranded in one worker, out of reach of other workers and of
+    'manage.py flush_driver_locations', and LocMem may cull them. Otherwise
+    each changed ping is written through to the database.
+    """
+    setting = getattr(settings, 'DRIVER_LOCATION_WRITE_BEHIND', None)
+    return cache_is_shared() if setting is None else setting
+
+
+def store(order_id, entry):
+    # Unflushed pings live as long as a driver may be out; clean snapshots
+    # only about a flush interval, so another worker's writes show up
+    timeout = entry_timeout() if entry['dirty'] or entry['trail'] else flush_interval()
+    cache.set(location_key(order_id), entry, timeout)
+
+
+def trail_limit():
+    # Pings buffered before a flush is forced, bounding the cache entry size
+    return getattr(settings, 'DRIVER_TRACK_MAX_BUFFER', 500)
+
+
+def store_tolerance():
+    # Points within this many metres of the line are not worth storing
+    return getattr(settings, 'DRIVER_TRACK_STORE_TOLERANCE', 2)
+
+
+def location_key(order_id):
+    return f'driver:location:{order_id}'
+
+
+def to_coordinate(value):
+    # Match the DecimalField(decimal_places=6) the coordinates are stored in
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(COORDINATE)
+
+
+def as_payload(entry):
+    return {
+        "lat": float(entry['lat']) if entry['lat'] else 0,
+        "lng": float(entry['lng']) if entry['lng'] else 0,
+        "status": entry['status'],
+    }
+
+
+# =========================
+# Reads
+# =========================
+def get_location(order_id):
+    """
+    Latest known position for an order: from the cache when a driver is
+    pinging, otherwise loaded from OrderTracking (and cached briefly).
+    Returns None when the order has no tracking row.
+    """
+    entry = cache.get(location_key(order_id))
+    if entry is not None and not entry['dirty'] and time.time() - entry['synced_at'] >= flush_interval():
+        # Kept for its buffered trail; the position may have moved on in another worker
+        row = tracking_row(order_id)
+        if row is None:
+            return None
+        entry.update(row, synced_at=time.time())
+        store(order_id, entry)
+    if entry is None:
+        row = tracking_row(order_id)
+        if row is None:
+            return None
+        entry = {**row, 'dirty': False, 'flushed_at': time.time(), 'synced_at': time.time(), 'trail': []}
+        store(order_id, entry)
+    return entry
+
+
+def tracking_row(order_id):
+    row = OrderTracking.objects.filter(order_id=order_id).values(
+        'driver_latitude', 'driver_longitude', 'status'
+    ).first()
+    if row is None:
+        return None
+    return {'lat': row['driver_latitude'], 'lng': row['driver_longitude'], 'status': row['status']}
+
+
+def overlay(tracking):
+    """
+    Copy the freshest cached position onto an OrderTracking instance,
+    which may be up to one flush interval behind.
+    """
+    entry = cache.get(location_key(tracking.order_id))
+    if entry is not None:
+        tracking.driver_latitude = entry['lat']
+        tracking.driver_longitude = entry['lng']
+        tracking.status = entry['status']
+    return tracking
+
+
+# =========================
+# Writes
+# =========================
+def record_ping(order_id, lat, lng, status):
+    """
+    Absorb one driver ping. Returns (entry, changed), or (None, False) when
+    the order does not exist.
+
+    The cache always holds the newest position, and buffers the route: a
+    chunk of it is written once per flush interval, when the buffer is
+    full, or straight away when the delivery status changes. With
+    write_behind(), OrderTracking is written along with the chunks;
+    otherwise the position alone is written through on every change.
+    """
+    previous = get_location(order_id)
+    if previous is None:
+        if not Order.objects.filter(id=order_id).exists():
+            return None, False
+        OrderTracking.objects.create(order_id=order_id)
+        previous = get_location(order_id)
+
+    lat, lng = to_coordinate(lat), to_coordinate(lng)
+    if (lat, lng, status) == (previous['lat'], previous['lng'], previous['status']):
+        return previous, False
+
+    trail = list(previous.get('trail', []))
+    if lat is not None and lng is not None:
+        trail.append((int(time.time() * 1000), geo.to_e6(lat), geo.to_e6(lng)))
+
+    entry = {
+        'lat': lat,
+        'lng': lng,
+        'status': status,
+        'dirty': True,
+        'flushed_at': previous['flushed_at'],
+        'synced_at': previous['synced_at'],
+        'trail': trail,
+    }
+    if (status != previous['status']
+            or time.time() - entry['flushed_at'] >= flush_interval()
+            or len(trail) >= trail_limit()):
+        flush(order_id, entry)
+    elif not write_behind():
+        write_position(order_id, entry)
+    store(order_id, entry)
+    return entry, True
+
+
+def write_position(order_id, entry):
+    # A narrow UPDATE instead of a full-row save(); update() skips auto_now
+    OrderTracking.objects.filter(order_id=order_id).update(
+        driver_latitude=entry['lat'],
+        driver_longitude=entry['lng'],
+        status=entry['status'],
+        updated_at=timezone.now(),
+    )
+    entry['dirty'] = False
+    entry['synced_at'] = time.time()
+
+
+def flush(order_id, entry):
+    write_position(order_id, entry)
+    if entry['trail']:
+        write_chunk(order_id, entry['trail'])
+    entry['flushed_at'] = time.time()
+    entry['trail'] = []
+
+
+def flush_pending(order_ids):
+    """
+    Write every dirty cached position for `order_ids` to the database.
+    Returns the number of rows flushed.
+    """
+    keys = {location_key(order_id): order_id for order_id in order_ids}
+    flushed = 0
+    for key, entry in cache.get_many(list(keys)).items():
+        if entry['dirty'] or entry['trail']:
+            flush(keys[key], entry)
+            store(keys[key], entry)
+            flushed += 1
+    return flushed
+
+
+# =========================
+# Route history
+# =========================
+def ms_to_datetime(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+
+
+def datetime_to_ms(value):
+    return round(value.timestamp() * 1000)
+
+
+def write_chunk(order_id, trail):
+    points = geo.douglas_peucker(trail, store_tolerance())
+    start_ms = points[0][0]
+    LocationTrackChunk.objects.create(
+        order_id=order_id,
+        started_at=ms_to_datetime(start_ms),
+        ended_at=ms_to_datetime(points[-1][0]),
+        point_count=len(points),
+        data=geo.encode_points(points, start_ms),
+    )
+
+
+def route_points(order_id):
+    """
+    Every stored (t_ms, lat_e6, lng_e6) point of an order's route, oldest
+    first, including pings still buffered in the cache.
+    """
+    points = []
+    chunks = LocationTrackChunk.objects.filter(order_id=order_id).values_list('started_at', 'data')
+    for started_at, data in chunks:
+        points.extend(geo.decode_points(data, datetime_to_ms(started_at)))
+
+    entry = cache.get(location_key(order_id))
+    if entry is not None:
+        points.extend(tuple(point) for point in entry.get('trail', []))
+    return points
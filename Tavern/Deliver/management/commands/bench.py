@@ -0,0 +1,123 @@
+import json
+import os
+import secrets
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from functools import partial
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from Deliver import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the storefront with scripted scenarios on concurrent workers "
+        "and report latency percentiles, throughput and query counts per endpoint. "
+        "By default requests go through the Django test client against a scratch "
+        "database; with --url they go to a running server instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(benchmark.SCENARIOS),
+                            help="Scenario to run (repeatable). Default: all of them.")
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=10, help="Rounds of the scenarios per worker.")
+        parser.add_argument('--products', type=int, default=200, help="Size of the generated catalog.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000. "
+                                          "Its database gets bench-* fixtures; needs --cleanup.")
+        parser.add_argument('--cleanup', action='store_true',
+                            help="With --url: agree to write fixtures to the server's database "
+                                 "and delete them (and the orders, guest carts and sessions the "
+                                 "run makes) afterwards.")
+        parser.add_argument('--output', help="Write the report as JSON to this file.")
+        parser.add_argument('--compare', help="A previous JSON report to show p95 changes against.")
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(benchmark.SCENARIOS)
+        if options['url'] and not options['cleanup']:
+            raise CommandError(
+                "--url writes fixtures to the server's database (the one in these settings) "
+                "and deletes them afterwards; pass --cleanup to go ahead."
+            )
+        if options['url']:
+            report = self.against_server(scenarios, options)
+        else:
+            report = self.in_process(scenarios, options)
+
+        report = {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'mode': 'http' if options['url'] else 'client',
+            'database': connection.vendor,
+            **report,
+        }
+        self.print_report(report)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+    # ---- modes ----
+    def in_process(self, scenarios, options):
+        workdir = tempfile.mkdtemp(prefix='bench-')
+        if connection.vendor == 'sqlite':
+            # A file, not the in-memory default, so worker threads share it
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            cache.clear()
+            fixtures = benchmark.create_fixtures(products=options['products'])
+            return benchmark.run(
+                scenarios, fixtures, partial(benchmark.ClientDriver, fixtures),
+                workers=options['workers'], iterations=options['iterations'], seed=options['seed'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def against_server(self, scenarios, options):
+        if benchmark.Product.objects.filter(slug__startswith=benchmark.BENCH_PREFIX).exists():
+            raise CommandError("bench-* fixtures already exist; is another run in progress?")
+        password = secrets.token_urlsafe(16)
+        fixtures = benchmark.create_fixtures(products=options['products'], password=password)
+        try:
+            return benchmark.run(
+                scenarios, fixtures,
+                partial(benchmark.HttpDriver, options['url'], fixtures, password=password),
+                workers=options['workers'], iterations=options['iterations'], seed=options['seed'],
+            )
+        finally:
+            benchmark.remove_fixtures(fixtures)
+
+    # ---- output ----
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['requests']} requests in {report['duration_s']}s "
+            f"({report['throughput_rps']} req/s) on {report['workers']} workers"
+        )
+        self.stdout.write(
+            f"{'endpoint':16} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'queries':>8}"
+        )
+        for label, row in report['endpoints'].items():
+            queries = '-' if row['queries_mean'] is None else row['queries_mean']
+            self.stdout.write(
+                f"{label:16} {row['requests']:>6} {row['errors']:>6} {row['throughput_rps']:>8} "
+                f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {queries:>8}"
+            )
+
+    def print_comparison(self, before, after):
+        self.stdout.write("p95 against the previous report:")
+        for label, row in after['endpoints'].items():
+            old = before.get('endpoints', {}).get(label)
+            if not old or not old['p95_ms']:
+                continue
+            change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+            self.stdout.write(f"  {label:16} {old['p95_ms']:>8} -> {row['p95_ms']:>8} ms ({change:+.0f}%)")
@@ -0,0 +1,151 @@
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+from django.db.utils import load_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Run checkout- and driver-ping-shaped write transactions from many "
+        "threads at once against SQLite in its default journal mode, the tuned "
+        "SQLite profile and, when configured, PostgreSQL. Reports throughput, "
+        "latency and lock errors for each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=200, help="Operations per thread.")
+        parser.add_argument('--read-ratio', type=float, default=0.5,
+                            help="Share of operations that only read (default 0.5).")
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench-db-')
+        try:
+            for number, (label, database) in enumerate(self.profiles(workdir)):
+                alias = f'bench_{number}'
+                database = connections.configure_settings({'default': dict(database)})['default']
+                self.connect(alias, database)
+                try:
+                    self.setup(alias)
+                    self.report(label, self.run(alias, database, options))
+                finally:
+                    self.teardown(alias)
+                    self.disconnect(alias)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def profiles(self, workdir):
+        yield 'SQLite (rollback journal)', {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'{workdir}/journal.sqlite3',
+        }
+        yield 'SQLite (WAL profile)', {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'{workdir}/wal.sqlite3',
+            'OPTIONS': settings.SQLITE_OPTIONS,
+        }
+        default = settings.DATABASES['default']
+        if default['ENGINE'] == 'django.db.backends.postgresql':
+            # Uses bench_* tables in the configured database, dropped afterwards
+            yield 'PostgreSQL', dict(default)
+
+    # ---- connections ----
+    def connect(self, alias, database):
+        # Private to the calling thread and never added to settings.DATABASES
+        backend = load_backend(database['ENGINE'])
+        connections[alias] = backend.DatabaseWrapper(database, alias)
+
+    def disconnect(self, alias):
+        connections[alias].close()
+        del connections[alias]
+
+    # ---- schema ----
+    def setup(self, alias):
+        connection = connections[alias]
+        serial = 'INTEGER PRIMARY KEY' if connection.vendor == 'sqlite' else 'BIGSERIAL PRIMARY KEY'
+        self.teardown(alias)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE bench_stock (id INTEGER PRIMARY KEY, qty INTEGER NOT NULL)')
+            cursor.execute(f'CREATE TABLE bench_order (id {serial}, product_id INTEGER NOT NULL, created REAL)')
+            cursor.execute('CREATE TABLE bench_tracking (id INTEGER PRIMARY KEY, lat REAL, lng REAL)')
+            cursor.executemany('INSERT INTO bench_stock (id, qty) VALUES (%s, %s)',
+                               [(i, 10 ** 9) for i in range(100)])
+            cursor.executemany('INSERT INTO bench_tracking (id, lat, lng) VALUES (%s, %s, %s)',
+                               [(i, -1.28, 36.82) for i in range(100)])
+
+    def teardown(self, alias):
+        with connections[alias].cursor() as cursor:
+            for table in ('bench_stock', 'bench_order', 'bench_tracking'):
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    # ---- workload ----
+    def operation(self, alias, rng, read_ratio):
+        roll = rng.random()
+        with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+            product_id = rng.randrange(100)
+            if roll < read_ratio:
+                cursor.execute('SELECT qty FROM bench_stock WHERE id = %s', [product_id])
+                cursor.fetchone()
+            elif roll < read_ratio + (1 - read_ratio) / 2:
+                # Checkout: read the line, conditionally decrement, insert the order
+                cursor.execute('SELECT qty FROM bench_stock WHERE id = %s', [product_id])
+                cursor.fetchone()
+                cursor.execute('UPDATE bench_stock SET qty = qty - 1 WHERE id = %s AND qty >= 1',
+                               [product_id])
+                cursor.execute('INSERT INTO bench_order (product_id, created) VALUES (%s, %s)',
+                               [product_id, time.time()])
+            else:
+                # Driver ping flushed to the tracking row
+                cursor.execute('UPDATE bench_tracking SET lat = %s, lng = %s WHERE id = %s',
+                               [rng.uniform(-1.3, -1.2), rng.uniform(36.7, 36.9), product_id])
+
+    def run(self, alias, database, options):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+
+        def worker(seed):
+            rng = random.Random(seed)
+            mine, failed = [], []
+            self.connect(alias, database)
+            start.wait()
+            try:
+                for _ in range(options['ops']):
+                    began = time.perf_counter()
+                    try:
+                        self.operation(alias, rng, options['read_ratio'])
+                        mine.append(time.perf_counter() - began)
+                    except DatabaseError as exc:
+                        failed.append(str(exc))
+            finally:
+                self.disconnect(alias)
+                with lock:
+                    latencies.extend(mine)
+                    errors.extend(failed)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors, time.perf_counter() - began
+
+    def report(self, label, result):
+        latencies, errors, elapsed = result
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0] * 99
+        self.stdout.write(
+            f"{label:28} {len(latencies) / elapsed:8.0f} ops/s   "
+            f"p50 {quantiles[49] * 1000:7.2f} ms   p95 {quantiles[94] * 1000:7.2f} ms   "
+            f"max {max(latencies, default=0) * 1000:8.2f} ms   errors {len(errors)}"
+        )
+        for message in sorted(set(errors)):
+            self.stdout.write(f"    {errors.count(message)} x {message}")
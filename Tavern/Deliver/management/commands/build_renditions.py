@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from Deliver import renditions
+from Deliver.models import Product
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/AVIF renditions for existing product images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Regenerate renditions that already exist.",
+        )
+
+    def handle(self, *args, **options):
+        names = (
+            Product.objects.exclude(image='')
+            .values_list('image', flat=True).distinct().iterator()
+        )
+        jobs = {
+            name: renditions.get_executor().submit(renditions.generate, name, options['force'])
+            for name in names
+        }
+
+        built = failed = 0
+        for name, job in jobs.items():
+            try:
+                job.result()
+                built += 1
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"{name}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Built renditions for {built} images ({failed} failed)."))
@@ -0,0 +1,141 @@
+import re
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from Deliver.models import (
+    Cart, CartItem, Category, Order, OrderItem, OrderTracking, Product, Promotion, SubCategory,
+)
+
+# Whole-table reads that are intended: the menu lists every category.
+ALLOWED_SCANS = {Category._meta.db_table, SubCategory._meta.db_table}
+
+EXPLAINED = re.compile(r'^\s*(SELECT|UPDATE|DELETE|WITH)\b', re.IGNORECASE)
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')  # no "USING INDEX", not a subquery or virtual table
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Request each view, EXPLAIN every query it runs and fail if any of "
+        "them reads a whole table. Works on a throwaway copy of a few rows "
+        "inside a transaction that is rolled back."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Query plans cannot be checked on {connection.vendor}.")
+
+        problems = []
+        try:
+            # The page and fragment caches would hide the queries
+            with transaction.atomic(), override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                ALLOWED_HOSTS=['*'],
+            ):
+                for name, run in self.scenarios(self.fixtures()):
+                    problems += self.check_scenario(name, run)
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if problems:
+            for name, table, sql in problems:
+                self.stderr.write(f"[{name}] full scan of {table}:\n    {sql}")
+            raise CommandError(f"{len(problems)} quer{'y' if len(problems) == 1 else 'ies'} read a whole table.")
+        self.stdout.write(self.style.SUCCESS("No full table scans."))
+
+    # ---- data ----
+    def fixtures(self):
+        category = Category.objects.create(name='Plan check', slug='plan-check')
+        subcategory = SubCategory.objects.create(category=category, name='Plan check', group_name='Plan check')
+        product = Product.objects.create(
+            name='Plan check', slug='plan-check', description='plan check', price=100, stock=10,
+            category=category, subcategory=subcategory, feature='popular', image='products/plan-check.jpg',
+        )
+        user = User.objects.create(username='plan-check', email='plan-check@example.com')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=product, quantity=1)
+        order = Order.objects.create(user=user, total_amount=100)
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=100)
+        OrderTracking.objects.create(order=order)
+        today = timezone.localdate()
+        Promotion.objects.create(title='Plan check', description='plan check', discount_percentage=10,
+                                 start_date=today, end_date=today)
+        return {'product': product, 'category': category, 'subcategory': subcategory, 'user': user,
+                'order': order}
+
+    # ---- what is checked ----
+    def scenarios(self, f):
+        anonymous = Client()
+        customer = Client()
+        customer.force_login(f['user'])
+        product, order = f['product'], f['order']
+        category, subcategory = f['category'], f['subcategory']
+
+        yield 'home', lambda: anonymous.get('/')
+        yield 'home popular', lambda: anonymous.get('/?filter=popular')
+        yield 'home by price', lambda: anonymous.get('/?sort=price')
+        yield 'search', lambda: anonymous.get('/?q=plan')
+        yield 'category', lambda: anonymous.get(f'/category/{category.slug}/')
+        yield 'subcategory', lambda: anonymous.get(f'/category/{category.slug}/{subcategory.slug}/')
+        yield 'more products', lambda: customer.get('/products/more/', {'category': category.slug})
+        yield 'product detail', lambda: anonymous.get(f'/product/{product.slug}/')
+        yield 'login by email', lambda: anonymous.post('/login/', {
+            'username_or_email': f['user'].email, 'password': 'wrong',
+        })
+        yield 'cart', lambda: customer.get('/cart/')
+        yield 'checkout', lambda: customer.get('/checkout/')
+        yield 'order history', lambda: customer.get('/orders/')
+        yield 'track order', lambda: customer.get(f'/track/{order.id}/')
+        yield 'driver location', lambda: customer.get(f'/driver-location/{order.id}/')
+        yield 'driver route', lambda: customer.get(f'/driver-route/{order.id}/')
+        yield 'payment status', lambda: anonymous.get(f'/checkout/intasend/status/{order.id}/')
+        yield 'promotions', lambda: anonymous.get('/promotions/')
+
+    # ---- plans ----
+    def check_scenario(self, name, run):
+        with CaptureQueriesContext(connection) as queries:
+            with self.savepoint():
+                run()
+
+        problems = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not EXPLAINED.match(sql):
+                continue
+            for table in self.full_scans(sql):
+                if table not in ALLOWED_SCANS:
+                    problems.append((name, table, sql))
+        self.stdout.write(f"{name}: {len(queries)} queries")
+        return problems
+
+    @contextmanager
+    def savepoint(self):
+        # A view that fails still leaves its queries to check
+        try:
+            with transaction.atomic():
+                yield
+        except Exception as exc:
+            self.stderr.write(f"    ({type(exc).__name__}: {exc})")
+
+    def full_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [row[-1] for row in cursor.fetchall()]
+                return [m.group(1) for m in map(SQLITE_SCAN.match, details) if m]
+            # Postgres picks a sequential scan of a tiny table even when an
+            # index exists; turning that off leaves only the unavoidable ones.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return [m.group(1) for (line,) in cursor.fetchall() for m in POSTGRES_SCAN.finditer(line)]
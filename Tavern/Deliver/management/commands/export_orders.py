@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Deliver import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Write orders with their lines and customer details as CSV or NDJSON, "
+        "streamed so memory stays flat for any date range."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--start', help="First day to include (YYYY-MM-DD).")
+        parser.add_argument('--end', help="Last day to include (YYYY-MM-DD).")
+        parser.add_argument('--status', action='append', default=[], help="Order status to include (repeatable).")
+        parser.add_argument('--output', help="File to write. Default: standard output.")
+
+    def handle(self, *args, **options):
+        try:
+            start = exports.parse_date(options['start'])
+            end = exports.parse_date(options['end'])
+        except ValueError:
+            raise CommandError("--start and --end must be YYYY-MM-DD.")
+
+        lines = exports.lines(options['format'], exports.order_rows(start, end, options['status']))
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+        self.stderr.write(f"Wrote {count} lines to {options['output']}.")
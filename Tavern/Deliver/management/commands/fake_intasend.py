@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from Deliver.fake_gateway import FakeIntaSendGateway
+
+
+class Command(BaseCommand):
+    help = "Run a local fake IntaSend gateway (point INTASEND_API_URL at it)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--delay', type=float, default=0.0, help="Seconds to wait before answering.")
+
+    def handle(self, *args, **options):
+        gateway = FakeIntaSendGateway(port=options['port'], delay=options['delay']).start()
+        self.stdout.write(self.style.SUCCESS(f"Fake IntaSend gateway listening on {gateway.url}"))
+        try:
+            gateway._thread.join()
+        except KeyboardInterrupt:
+            gateway.stop()
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from Deliver import location_store
+from Deliver.models import OrderTracking
+
+
+class Command(BaseCommand):
+    help = "Write cached driver positions that have not reached OrderTracking yet."
+
+    def handle(self, *args, **options):
+        if not location_store.write_behind():
+            # Pings were written through; a per-process cache holds nothing for us
+            self.stdout.write("Write-behind is off; driver positions are already in the database.")
+            return
+        active = (
+            OrderTracking.objects.exclude(status='delivered')
+            .values_list('order_id', flat=True)
+            .distinct()
+        )
+        flushed = location_store.flush_pending(list(active))
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} driver position(s)."))
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Deliver.catalog_import import CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update products from a CSV or JSON-lines file, streamed in batches. "
+        "Columns: name, price (required); slug, category, subcategory, group, description, "
+        "old_price, stock, size, country, feature, image, accolades. Products are matched "
+        "on slug; categories and subcategories on name or slug, and created when missing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for standard input.")
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help="Input format. Default: from the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per upsert statement.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            extension = os.path.splitext(path)[1].lower()
+            fmt = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(extension)
+            if fmt is None:
+                raise CommandError("Cannot tell the format from the file name; pass --format.")
+
+        importer = CatalogImporter(batch_size=options['batch_size'])
+        started = time.perf_counter()
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        try:
+            importer.run(read_rows(stream, fmt), progress=self.progress if options['verbosity'] > 1 else None)
+        except ValueError as exc:
+            raise CommandError(f"Could not read {path}: {exc}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        seconds = time.perf_counter() - started
+
+        for number, error in importer.errors[:20]:
+            self.stderr.write(f"Line {number}: {error}")
+        if len(importer.errors) > 20:
+            self.stderr.write(f"... and {len(importer.errors) - 20} more.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {importer.imported} products in {seconds:.1f}s "
+            f"({importer.imported / seconds if seconds else 0:.0f} rows/s); "
+            f"{importer.created_categories} categories/subcategories created, "
+            f"{len(importer.errors)} rows skipped."
+        ))
+        if importer.imported:
+            self.stdout.write("Run 'manage.py build_renditions' if the import brought new images.")
+
+    def progress(self, imported, seconds):
+        self.stdout.write(f"  {imported} rows ({imported / seconds:.0f} rows/s)")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Deliver import payment_events
+
+
+class Command(BaseCommand):
+    help = "Apply queued payment gateway callbacks to their orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help="Keep polling the queue.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = payment_events.drain(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} payment event(s).")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Deliver import profiling
+
+
+class Command(BaseCommand):
+    help = "Print a signed header value that makes the server profile the requests carrying it."
+
+    def handle(self, *args, **options):
+        header = getattr(settings, 'PROFILE_HEADER', 'X-Profile')
+        max_age = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 60 * 60)
+        self.stdout.write(f"{header}: {profiling.make_token()}")
+        self.stderr.write(f"Valid for {max_age // 60} minutes.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Deliver import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute the 'customers also bought' table from paid orders."
+
+    def handle(self, *args, **options):
+        count = recommendations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} product neighbours."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Deliver import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the catalog search index from the Product table."
+
+    def handle(self, *args, **options):
+        count = search.get_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products."))
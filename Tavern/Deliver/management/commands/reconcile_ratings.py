@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from Deliver import ratings
+
+
+class Command(BaseCommand):
+    help = "Backfill or reconcile the stored rating aggregates on Product."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help="Only report products whose aggregates have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = list(ratings.find_drift().values_list('id', flat=True))
+
+        if options['check']:
+            if drifted:
+                self.stdout.write(self.style.WARNING(
+                    f"{len(drifted)} product(s) have drifted: {drifted}"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS("All rating aggregates are in sync."))
+            return
+
+        updated = ratings.recompute_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed ratings for {updated} products ({len(drifted)} had drifted)."
+        ))
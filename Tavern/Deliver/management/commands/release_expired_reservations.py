@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Deliver import inventory
+
+
+class Command(BaseCommand):
+    help = "Return stock held by unpaid orders whose reservation has expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep checking for expired holds.")
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between checks with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            released = inventory.release_expired()
+            if released:
+                self.stdout.write(f"Released {released} expired reservation(s).")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
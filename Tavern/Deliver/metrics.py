@@ -0,0 +1,368 @@
+# Deliver/metrics.py
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no multi-process servers to coordinate
+    fcntl = None
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# =========================
+# Registry
+# =========================
+class Registry:
+    """
+    Metric values live in one dict per thread, written only by that thread,
+    so recording takes no lock. A scrape adds the shards up. When a thread
+    ends, its shard is folded into `retired` so counters never go backwards.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.retired = {}
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            weakref.finalize(threading.current_thread(), self._retire, shard)
+            return shard
+
+    def _retire(self, shard):
+        with self._lock:
+            self._shards.remove(shard)
+            merge(self.retired, shard, self.metrics)
+
+    def snapshot(self):
+        """{(name, label values): value} summed over every thread of this process."""
+        with self._lock:
+            total = {}
+            merge(total, self.retired, self.metrics)
+            for shard in self._shards:
+                merge(total, shard, self.metrics)
+        return total
+
+
+def merge(into, values, metrics):
+    for key, value in list(values.items()):
+        metric = metrics.get(key[0])
+        if metric is None:
+            continue
+        if metric.kind == 'histogram':
+            current = into.get(key)
+            into[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+registry = Registry()
+
+
+# =========================
+# Metric types
+# =========================
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        registry.register(self)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = registry.shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = registry.shard()
+        key = (self.name, labels)
+        # Per-bucket counts (the last one is +Inf), then sum
+        row = shard.get(key)
+        if row is None:
+            row = shard[key] = [0] * (len(self.buckets) + 2)
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+
+# =========================
+# Application metrics
+# =========================
+REQUEST_DURATION = Histogram(
+    'tavern_http_request_duration_seconds', "Time to produce a response, by view.", ('view', 'method'),
+)
+REQUESTS = Counter('tavern_http_requests_total', "Responses sent, by view and status.", ('view', 'status'))
+IN_FLIGHT = Gauge('tavern_http_requests_in_flight', "Requests being handled right now.")
+DB_QUERIES = Counter('tavern_db_queries_total', "Database queries run, by view.", ('view',))
+DB_SECONDS = Counter('tavern_db_seconds_total', "Time spent in database queries, by view.", ('view',))
+ORDERS_CREATED = Counter('tavern_orders_created_total', "Orders placed at checkout.")
+PAYMENTS = Counter(
+    'tavern_payments_total', "IntaSend payment outcomes applied to orders.", ('outcome',),
+)
+DRIVER_PINGS = Counter('tavern_driver_pings_total', "Driver location updates received.")
+CACHE_LOOKUPS = Counter('tavern_cache_lookups_total', "Application cache lookups.", ('cache', 'result'))
+
+
+def cache_lookup(name, hit):
+    CACHE_LOOKUPS.inc(name, 'hit' if hit else 'miss')
+
+
+# =========================
+# Multi-process aggregation
+# =========================
+# With METRICS_DIR set, each process writes its snapshot there every
+# METRICS_FLUSH_INTERVAL seconds (and at exit), and a scrape of any
+# process adds up all the files. A scrape folds the counters of exited
+# processes into one RETIRED_FILE and deletes their files, so totals never
+# drop and the directory does not grow with every restart; their gauges
+# are dropped.
+RETIRED_FILE = 'metrics-retired.json'
+_last_flush = 0.0
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def encode(snapshot):
+    return [[name, list(labels), value] for (name, labels), value in snapshot.items()]
+
+
+def decode(rows):
+    return {(name, tuple(labels)): value for name, labels, value in rows}
+
+
+def write_values(path, values):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(encode(values), f)
+    os.replace(tmp, path)
+
+
+def read_values(path):
+    with open(path) as f:
+        return decode(json.load(f))
+
+
+def flush():
+    global _last_flush
+    directory = metrics_dir()
+    if not directory:
+        return
+    _last_flush = time.monotonic()
+    os.makedirs(directory, exist_ok=True)
+    write_values(os.path.join(directory, f'metrics-{os.getpid()}.json'), registry.snapshot())
+
+
+def maybe_flush():
+    if metrics_dir() and time.monotonic() - _last_flush > getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        flush()
+
+
+atexit.register(flush)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def directory_lock(directory):
+    """Serialises scrapes, so a fold is never seen half done or done twice."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def counters_only(values):
+    return {key: value for key, value in values.items()
+            if key[0] in registry.metrics and registry.metrics[key[0]].kind != 'gauge'}
+
+
+def collect():
+    """This process's live values plus the last flush of every other process."""
+    total = registry.snapshot()
+    directory = metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return total
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    with directory_lock(directory):
+        try:
+            retired = read_values(retired_path)
+        except (OSError, ValueError):
+            retired = {}
+        exited = []
+        for filename in os.listdir(directory):
+            pid = filename[len('metrics-'):-len('.json')]
+            if not (filename.startswith('metrics-') and filename.endswith('.json') and pid.isdigit()):
+                continue
+            if int(pid) == os.getpid():
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                values = read_values(path)
+            except (OSError, ValueError):
+                continue  # being replaced; the next scrape will read it
+            if pid_alive(int(pid)):
+                merge(total, values, registry.metrics)
+            else:
+                merge(retired, counters_only(values), registry.metrics)
+                exited.append(path)
+        if exited:
+            write_values(retired_path, retired)
+            for path in exited:
+                os.remove(path)
+    merge(total, retired, registry.metrics)
+    return total
+
+
+# =========================
+# Exposition
+# =========================
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(values=None):
+    """The Prometheus text exposition format (version 0.0.4)."""
+    values = collect() if values is None else values
+    by_metric = {}
+    for (name, labels), value in values.items():
+        by_metric.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, metric in registry.metrics.items():
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, value in sorted(by_metric.get(name, ())):
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{format_labels(metric.labels, labels)} {format_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                cumulative += count
+                le = format_labels(metric.labels, labels, [('le', format_number(bound))])
+                lines.append(f'{name}_bucket{le} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(metric.labels, labels)} {format_number(value[-1])}')
+            lines.append(f'{name}_count{format_labels(metric.labels, labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+# =========================
+# Middleware
+# =========================
+def record_response(request, response, seconds):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else 'unresolved'
+    REQUEST_DURATION.observe(seconds, view, request.method)
+    REQUESTS.inc(view, str(response.status_code))
+    stats = getattr(request, 'query_stats', None)
+    if stats is not None:
+        DB_QUERIES.inc(view, amount=stats.count)
+        DB_SECONDS.inc(view, amount=stats.seconds)
+    maybe_flush()
+
+
+class MetricsMiddleware:
+    """
+    Request latency by view, requests in flight, and the database time
+    QueryStatsMiddleware measured (list it after this one). Streaming
+    responses are timed to the first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            IN_FLIGHT.dec()
+        record_response(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            IN_FLIGHT.dec()
+        record_response(request, response, time.perf_counter() - started)
+        return response
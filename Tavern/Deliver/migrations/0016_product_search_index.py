@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:00
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Product = apps.get_model('Deliver', 'Product')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS deliver_product_fts USING fts5("
+        "name, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO deliver_product_fts (rowid, name, description) '
+        f'SELECT id, name, description FROM "{Product._meta.db_table}"'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS deliver_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0015_ordertracking'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
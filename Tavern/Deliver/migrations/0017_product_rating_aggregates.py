@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:33
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Sum
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('Deliver', 'Product')
+    ProductRating = apps.get_model('Deliver', 'ProductRating')
+    totals = (
+        ProductRating.objects.values('product')
+        .annotate(total=Sum('rating'), count=Count('id'), average=Avg('rating'))
+    )
+    for row in totals:
+        Product.objects.filter(pk=row['product']).update(
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            rating_average=row['average'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0016_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
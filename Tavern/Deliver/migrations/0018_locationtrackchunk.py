@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0017_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationTrackChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_chunks', to='Deliver.order')),
+            ],
+            options={
+                'ordering': ['order', 'started_at'],
+                'indexes': [models.Index(fields=['order', 'started_at'], name='Deliver_loc_order_i_2bfb4c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0018_locationtrackchunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(help_text='Gateway invoice id, or api_ref if absent', max_length=100)),
+                ('state', models.CharField(max_length=30)),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='payment_event_pending_idx')],
+                'constraints': [models.UniqueConstraint(fields=('reference', 'state'), name='unique_payment_event')],
+            },
+        ),
+    ]
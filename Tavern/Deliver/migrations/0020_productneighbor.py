@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0019_paymentevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='Deliver.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='Deliver.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-score'], name='product_neighbor_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'neighbor'), name='unique_product_neighbor')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0021_stockreservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['feature', '-created_at'], name='product_feature_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['subcategory', '-created_at', '-id'], name='product_subcat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promotion',
+            index=models.Index(condition=models.Q(('active', True)), fields=['start_date', 'end_date'], name='promotion_active_dates_idx'),
+        ),
+        # Login accepts an email address (User.objects.get(email=...)); auth_user
+        # belongs to django.contrib.auth, so its index is created directly.
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS deliver_auth_user_email_idx ON auth_user (email)',
+            reverse_sql='DROP INDEX IF EXISTS deliver_auth_user_email_idx',
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0022_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('query_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('db_ms', models.FloatField(blank=True, null=True)),
+                ('trigger', models.CharField(choices=[('sampled', 'Sampled'), ('header', 'Signed header'), ('toggle', 'Admin toggle')], max_length=10)),
+                ('pstats', models.BinaryField(blank=True, null=True)),
+                ('collapsed', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-duration_ms'], name='request_profile_slowest_idx')],
+            },
+        ),
+    ]
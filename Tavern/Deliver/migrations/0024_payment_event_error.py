@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Deliver', '0023_request_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentevent',
+            name='error',
+            field=models.TextField(blank=True, help_text='Why applying the event failed; empty if it succeeded'),
+        ),
+    ]
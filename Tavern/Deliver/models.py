@@ -61,6 +61,22 @@ class Product(models.Model):
     # Accolades (Description Tab)
     accolades = models.TextField(blank=True, null=True, help_text="Awards and recognition")
 
+    # Rating aggregates, kept in step with ProductRating by Deliver.ratings
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Home page rows: feature='new'/'popular', newest first
+            models.Index(fields=['feature', '-created_at'], name='product_feature_created_idx'),
+            # Keyset orderings of the product grid (see views.CATALOG_ORDERINGS)
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+            models.Index(fields=['subcategory', '-created_at', '-id'], name='product_subcat_created_idx'),
+        ]
+
     # ... keep existing methods ...
     def discount_percentage(self):
         if self.old_price and self.old_price > self.price:
@@ -76,11 +92,11 @@ class Product(models.Model):
         return self.name
     @property
     def average_rating(self):
-        return self.ratings.aggregate(avg=Avg('rating'))['avg'] or 0
+        return self.rating_average
 
     @property
     def review_count(self):
-        return self.ratings.count()
+        return self.rating_count
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -121,6 +137,13 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Order history: one user's orders, newest first (keyset pages)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id}"
 
@@ -140,6 +163,13 @@ class ProductRating(models.Model):
     class Meta:
         unique_together = ('product', 'user')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was stored so the Product aggregates can be adjusted by a delta
+        instance._stored_rating = (instance.__dict__.get('product_id'), instance.__dict__.get('rating'))
+        return instance
+
 
 class WebsiteRating(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -155,6 +185,13 @@ class Promotion(models.Model):
     end_date = models.DateField()
     active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Only running promotions are ever listed
+            models.Index(fields=['start_date', 'end_date'], condition=models.Q(active=True),
+                         name='promotion_active_dates_idx'),
+        ]
+
 class OrderTracking(models.Model):
 
     STATUS_CHOICES = (
@@ -175,4 +212,125 @@ class OrderTracking(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Tracking Order #{self.order.id}"
\ No newline at end of file
+        return f"Tracking Order #{self.order.id}"
+
+class LocationTrackChunk(models.Model):
+    """
+    A run of driver positions for one order, delta-encoded by Deliver.geo.
+    Written by the location store whenever it flushes to OrderTracking.
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="location_chunks")
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['order', 'started_at']
+        indexes = [models.Index(fields=['order', 'started_at'])]
+
+    def __str__(self):
+        return f"Track chunk for Order #{self.order_id} ({self.point_count} points)"
+
+
+class PaymentEvent(models.Model):
+    """
+    An inbound payment gateway callback, stored as received and applied to
+    its order later by Deliver.payment_events.
+    """
+    reference = models.CharField(max_length=100, help_text="Gateway invoice id, or api_ref if absent")
+    state = models.CharField(max_length=30)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, help_text="Why applying the event failed; empty if it succeeded")
+
+    class Meta:
+        constraints = [
+            # A retried callback is the same (reference, state) pair
+            models.UniqueConstraint(fields=['reference', 'state'], name='unique_payment_event'),
+        ]
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True),
+                         name='payment_event_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reference} {self.state}"
+
+
+class ProductNeighbor(models.Model):
+    """
+    "Customers also bought": how many paid orders contained both products.
+    Kept to the top RELATED_PRODUCTS_STORED per product by Deliver.recommendations.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="neighbors")
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="neighbor_of")
+    score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'neighbor'], name='unique_product_neighbor'),
+        ]
+        indexes = [models.Index(fields=['product', '-score'], name='product_neighbor_score_idx')]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.neighbor_id} ({self.score})"
+
+
+class StockReservation(models.Model):
+    """
+    Stock taken off Product.stock for one order line while the order awaits
+    payment. Managed by Deliver.inventory: committed when the order is paid,
+    or handed back to the product when payment fails or the hold expires.
+    """
+    STATE_CHOICES = (
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], condition=models.Q(state='held'),
+                         name='stock_reservation_held_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for Order #{self.order_id} ({self.state})"
+
+
+class RequestProfile(models.Model):
+    """
+    One profiled request, stored by Deliver.profiling: a cProfile dump
+    (pstats) or collapsed stacks from the sampler, whichever PROFILER ran.
+    """
+    TRIGGER_CHOICES = (
+        ('sampled', 'Sampled'),
+        ('header', 'Signed header'),
+        ('toggle', 'Admin toggle'),
+    )
+
+    view_name = models.CharField(max_length=200, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(null=True, blank=True)
+    db_ms = models.FloatField(null=True, blank=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    pstats = models.BinaryField(null=True, blank=True)
+    collapsed = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['-duration_ms'], name='request_profile_slowest_idx')]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
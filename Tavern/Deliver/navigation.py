@@ -0,0 +1,74 @@
+# Deliver/navigation.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .models import Category, SubCategory
+
+NAV_VERSION_KEY = 'nav:version'
+
+
+def nav_cache_timeout():
+    return getattr(settings, 'NAV_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+# =========================
+# Version key
+# =========================
+def get_nav_version():
+    version = cache.get(NAV_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted key never reuses an old version
+        cache.add(NAV_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(NAV_VERSION_KEY)
+    return version
+
+
+def bump_nav_version():
+    try:
+        cache.incr(NAV_VERSION_KEY)
+    except ValueError:
+        cache.set(NAV_VERSION_KEY, int(time.time() * 1000), None)
+
+
+# =========================
+# Menu tree
+# =========================
+def build_nav_tree():
+    """
+    Category -> group_name -> subcategory tree as plain dicts/lists,
+    built from exactly two queries.
+    """
+    tree = []
+    by_category = {}
+
+    for category in Category.objects.order_by('id').values('id', 'name', 'slug'):
+        node = {'name': category['name'], 'slug': category['slug'], 'groups': []}
+        by_category[category['id']] = node
+        tree.append(node)
+
+    subcategories = SubCategory.objects.order_by('group_name', 'name').values(
+        'category_id', 'group_name', 'name', 'slug'
+    )
+    for sub in subcategories:
+        groups = by_category[sub['category_id']]['groups']
+        # Same grouping as {% regroup %}: consecutive rows with the same group_name
+        if not groups or groups[-1]['name'] != sub['group_name']:
+            groups.append({'name': sub['group_name'], 'subcategories': []})
+        groups[-1]['subcategories'].append({'name': sub['name'], 'slug': sub['slug']})
+
+    return tree
+
+
+def get_nav_tree(version=None):
+    if version is None:
+        version = get_nav_version()
+    key = f'nav:tree:{version}'
+    tree = cache.get(key)
+    metrics.cache_lookup('nav', tree is not None)
+    if tree is None:
+        tree = build_nav_tree()
+        cache.set(key, tree, nav_cache_timeout())
+    return tree
@@ -0,0 +1,100 @@
+# Deliver/page_cache.py
+import hashlib
+import re
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from . import cart_summary, metrics
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CSRF_PLACEHOLDER = '__csrf_token__'
+CSRF_INPUT = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def page_cache_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 15)
+
+
+# =========================
+# Version key
+# =========================
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted key never reuses an old version
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+
+
+# =========================
+# Page cache
+# =========================
+def is_cacheable(request):
+    """
+    Only the page every anonymous visitor gets: no login, nothing in the
+    cart (the badge shows 0) and no flash messages waiting to be shown.
+    """
+    if request.method != 'GET' or request.user.is_authenticated:
+        return False
+    if cart_summary.get_request_summary(request)['item_count']:
+        return False
+    return not len(messages.get_messages(request))  # len() does not consume them
+
+
+def page_key(request, query_params):
+    # Only the parameters the view reads, so ?utm_source=... shares the entry
+    query = urlencode(sorted(
+        (name, value) for name in query_params for value in request.GET.getlist(name)
+    ))
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'page:{get_catalog_version()}:{digest}'
+
+
+def cache_anonymous_page(query_params=()):
+    """
+    Cache a catalog view's rendered page for anonymous visitors until the
+    catalog changes (see bump_catalog_version). CSRF tokens are punched out
+    of the stored HTML and filled in per visitor when it is served.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, query_params)
+            cached = cache.get(key)
+            metrics.cache_lookup('page', cached is not None)
+            if cached is not None:
+                content, content_type = cached
+                if CSRF_PLACEHOLDER in content:
+                    content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Page-Cache'] = 'hit'
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                content = CSRF_INPUT.sub(
+                    rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', response.content.decode(response.charset)
+                )
+                cache.set(key, (content, response['Content-Type']), page_cache_timeout())
+                response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,99 @@
+# Deliver/pagination.py
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# =========================
+# Keyset (cursor) pagination
+# =========================
+class KeysetPaginator:
+    """
+    Pages through a queryset by remembering the sort key of the last row
+    instead of an OFFSET, so every page costs the same indexed range scan.
+
+    `ordering` must end in a unique field (normally '-id' or 'id') so the
+    key is a total order. Annotations (e.g. a search rank) may be used too.
+    """
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+        self.page_size = page_size
+
+    # ---- cursor encoding ----
+    def encode_cursor(self, obj):
+        key = [str(getattr(obj, name)) for name, _ in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if len(raw) != len(self.ordering):
+                raise ValueError(cursor)
+            return [self.to_python(name, value) for (name, _), value in zip(self.ordering, raw)]
+        except Exception as exc:
+            raise InvalidCursor(cursor) from exc
+
+    def to_python(self, name, value):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field.to_python(value)
+        return self.queryset.model._meta.get_field(name).to_python(value)
+
+    # ---- filtering ----
+    def after(self, values):
+        """
+        Rows strictly after `values` in the ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for (prev_name, _), prev_value in zip(self.ordering[:i], values[:i]):
+                step &= Q(**{prev_name: prev_value})
+            condition |= step
+        return self.queryset.filter(condition)
+
+    def page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            queryset = self.after(self.decode_cursor(cursor))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+        )
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
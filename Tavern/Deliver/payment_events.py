@@ -0,0 +1,156 @@
+# Deliver/payment_events.py
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import inventory, metrics
+from .models import Order, PaymentEvent
+from .realtime import notify_order_status
+
+logger = logging.getLogger(__name__)
+
+# Gateway state -> (new order status, statuses it may be reached from).
+# Anything else (a late FAILED after paid, a duplicate COMPLETE) is a no-op.
+TRANSITIONS = {
+    'COMPLETE': ('paid', ('pending', 'payment_initiated', 'payment_failed')),
+    'FAILED': ('payment_failed', ('pending', 'payment_initiated')),
+}
+
+
+# =========================
+# Intake (webhook side)
+# =========================
+def record_event(data):
+    """
+    Append one gateway callback to the queue: a single INSERT, with
+    retried deliveries of the same (reference, state) silently ignored.
+    """
+    reference = str(data.get('invoice_id') or data.get('api_ref') or '')[:100]
+    state = str(data.get('state') or '')[:30]
+    PaymentEvent.objects.bulk_create(
+        [PaymentEvent(reference=reference, state=state, payload=data)],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(inline_worker.kick)
+
+
+# =========================
+# Processing (worker side)
+# =========================
+def order_id_for(event):
+    reference = event.payload.get('api_ref')
+    if not isinstance(reference, str) or not reference.startswith('ORDER-'):
+        return None
+    try:
+        return int(reference.split('-')[1])
+    except ValueError:
+        return None
+
+
+def apply_event(event):
+    """
+    Move the order along with a conditional UPDATE, so replays and
+    out-of-order callbacks can never undo a later state.
+    Returns the new status, or None if nothing changed.
+    """
+    order_id = order_id_for(event)
+    transition = TRANSITIONS.get(event.state)
+    if order_id is None or transition is None:
+        return None
+
+    new_status, from_statuses = transition
+    updated = Order.objects.filter(id=order_id, status__in=from_statuses).update(status=new_status)
+    if not updated:
+        return None
+
+    if new_status == 'paid':
+        inventory.commit(order_id)
+    elif new_status == 'payment_failed':
+        inventory.release_order(order_id)
+    notify_order_status(order_id, new_status)
+    outcome = 'completed' if new_status == 'paid' else 'failed'
+    transaction.on_commit(lambda: metrics.PAYMENTS.inc(outcome))
+    return new_status
+
+
+def process_batch(batch_size=None):
+    """
+    Apply up to `batch_size` queued events in one transaction, each in its
+    own savepoint: an event that raises is rolled back alone, marked
+    processed with its `error`, and the rest of the batch goes ahead.
+    Returns how many were taken off the queue.
+    """
+    batch_size = batch_size or getattr(settings, 'PAYMENT_EVENTS_BATCH_SIZE', 100)
+    with transaction.atomic():
+        # skip_locked lets several workers share the queue on PostgreSQL
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        failed = []
+        for event in events:
+            try:
+                with transaction.atomic():
+                    apply_event(event)
+            except Exception as exc:
+                logger.exception("Could not apply payment event %s", event.id)
+                event.error = f'{type(exc).__name__}: {exc}'
+                failed.append(event)
+        now = timezone.now()
+        PaymentEvent.objects.filter(id__in=[event.id for event in events]).update(processed_at=now)
+        if failed:
+            PaymentEvent.objects.bulk_update(failed, ['error'])
+    return len(events)
+
+
+def drain(batch_size=None):
+    total = 0
+    while True:
+        processed = process_batch(batch_size)
+        total += processed
+        if not processed:
+            return total
+
+
+# =========================
+# In-process worker
+# =========================
+class InlineWorker:
+    """
+    A background thread in the web process that drains the queue whenever
+    the webhook appends to it, so status waiters in this process are woken
+    without a separate worker. Disable with PAYMENT_EVENTS_INLINE_WORKER
+    and run 'manage.py process_payment_events' instead.
+    """
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def kick(self):
+        if not getattr(settings, 'PAYMENT_EVENTS_INLINE_WORKER', True):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='payment-events', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                drain()
+            except Exception:
+                logger.exception("Processing payment events failed")
+            finally:
+                connection.close()
+
+
+inline_worker = InlineWorker()
@@ -0,0 +1,231 @@
+# Deliver/profiling.py
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+TOGGLE_KEY = 'profiling:all-requests'
+TOKEN_SALT = 'Deliver.profiling'
+
+
+# =========================
+# Triggers
+# =========================
+def make_token():
+    """A value for the PROFILE_HEADER header, valid for PROFILE_TOKEN_MAX_AGE."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def valid_token(value):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 60 * 60)
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def enable_all(seconds):
+    """
+    The admin toggle: profile every request for the next `seconds`. It lives
+    in the default cache, so it reaches every worker process only when that
+    cache is shared (REDIS_URL); with a per-process cache only the process
+    that took the admin's request profiles.
+    """
+    cache.set(TOGGLE_KEY, time.time() + seconds, seconds)
+
+
+def disable_all():
+    cache.delete(TOGGLE_KEY)
+
+
+def all_enabled_until():
+    return cache.get(TOGGLE_KEY)
+
+
+def trigger_for(request, enabled_until):
+    """Why this request should be profiled (given all_enabled_until()), or None."""
+    header = request.headers.get(getattr(settings, 'PROFILE_HEADER', 'X-Profile'))
+    if header and valid_token(header):
+        return 'header'
+    if enabled_until:
+        return 'toggle'
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    if rate and random.randrange(rate) == 0:
+        return 'sampled'
+    return None
+
+
+# =========================
+# Profilers
+# =========================
+class StackSampler:
+    """
+    Statistical profiler: a thread that snapshots the profiled thread's
+    stack every `interval` seconds. Cheaper than cProfile on deep call
+    trees, and the samples come out as collapsed stacks for flame graphs.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{frame.f_globals.get('__name__', '?')}.{code.co_qualname}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common())
+
+
+def profile_call(func, *args):
+    """
+    Run func(*args) under the PROFILER; returns (result, pstats bytes,
+    collapsed stacks), with None for both if no profile could be taken.
+    """
+    if getattr(settings, 'PROFILER', 'cprofile') == 'sampler':
+        sampler = StackSampler(getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005))
+        sampler.start()
+        try:
+            result = func(*args)
+        finally:
+            sampler.stop()
+        return result, None, sampler.collapsed()
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one cProfile per process: another thread's
+        # request is being profiled, so this one runs without
+        return func(*args), None, None
+    try:
+        result = func(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, marshal.dumps(profiler.stats), ''
+
+
+def summary(pstats_data, limit=25):
+    """The top functions by cumulative time, as pstats prints them."""
+    out = io.StringIO()
+    stats = pstats.Stats(stream=out)
+    stats.stats = marshal.loads(pstats_data)
+    stats.get_top_level_stats()
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+# =========================
+# Storage
+# =========================
+def save(request, response, trigger, seconds, pstats_data, collapsed):
+    match = getattr(request, 'resolver_match', None)
+    stats = getattr(request, 'query_stats', None)
+    RequestProfile.objects.create(
+        view_name=(match.view_name if match else '')[:200],
+        method=request.method,
+        path=request.get_full_path()[:500],
+        status_code=response.status_code,
+        duration_ms=seconds * 1000,
+        query_count=stats.count if stats else None,
+        db_ms=stats.db_ms if stats else None,
+        trigger=trigger,
+        pstats=pstats_data,
+        collapsed=collapsed,
+    )
+    trim()
+
+
+def trim():
+    """Keep only the newest PROFILE_KEEP profiles."""
+    keep = getattr(settings, 'PROFILE_KEEP', 500)
+    oldest_kept = (
+        RequestProfile.objects.order_by('-id').values_list('id', flat=True)[keep - 1:keep].first()
+    )
+    if oldest_kept is not None:
+        RequestProfile.objects.filter(id__lt=oldest_kept).delete()
+
+
+# =========================
+# Middleware
+# =========================
+class ProfilerMiddleware:
+    """
+    Profiles 1 in PROFILE_SAMPLE_RATE requests, every request carrying a
+    signed PROFILE_HEADER ('manage.py profiling_token'), or everything while
+    the admin toggle is on, and stores a RequestProfile for each.
+
+    Place it before QueryStatsMiddleware so stored profiles carry the query
+    counts without counting their own INSERT. Under ASGI a profiled request
+    runs the rest of the chain from a worker thread, so sync views (and the
+    sync middleware around them) run in the profiled thread; the code of
+    async views runs on the event loop and shows up only as waiting.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = trigger_for(request, all_enabled_until())
+        if trigger is None:
+            return self.get_response(request)
+        return self.profile(request, trigger, self.get_response)
+
+    async def __acall__(self, request):
+        trigger = trigger_for(request, await cache.aget(TOGGLE_KEY))
+        if trigger is None:
+            return await self.get_response(request)
+        return await sync_to_async(self.profile)(request, trigger, async_to_sync(self.get_response))
+
+    def profile(self, request, trigger, get_response):
+        started = time.perf_counter()
+        response, pstats_data, collapsed = profile_call(get_response, request)
+        seconds = time.perf_counter() - started
+        if collapsed is None:
+            return response  # the profiler was busy
+        try:
+            save(request, response, trigger, seconds, pstats_data, collapsed)
+        except Exception:
+            logger.exception("Could not store the profile of %s", request.path)
+        return response
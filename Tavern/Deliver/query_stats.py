@@ -0,0 +1,199 @@
+# Deliver/query_stats.py
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# The stats of the request running in this context. Context variables follow
+# the request into sync_to_async threads, so async views are covered too.
+_current = ContextVar('query_stats', default=None)
+
+
+# =========================
+# Fingerprints
+# =========================
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    The shape of a statement: literals and IN-lists collapsed, so the same
+    query for different rows (the N in N+1) shares a fingerprint.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+# =========================
+# Collection
+# =========================
+class QueryStats:
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    @property
+    def db_ms(self):
+        return self.seconds * 1000
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """Fingerprints run more than once, most repeated first."""
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n > 1]
+
+
+def _execute(execute, sql, params, many, context):
+    # Installed on every connection; costs one lookup when nothing is collecting
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record(sql, time.perf_counter() - started)
+
+
+def install(connection):
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+def install_on_open_connections():
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+def collect(stats):
+    """Route this context's queries into `stats`; returns a reset token."""
+    install_on_open_connections()
+    return _current.set(stats)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+# =========================
+# Reporting
+# =========================
+def budget_for(view_name):
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, budgets.get('*'))
+
+
+def server_timing(stats, total_seconds):
+    return (
+        f'db;dur={stats.db_ms:.1f};desc="{stats.count} queries", '
+        f'app;dur={total_seconds * 1000:.1f}'
+    )
+
+
+def timing_visible(user):
+    # The header would tell anyone how hard each view works the database
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+def report(request, response, stats, total_seconds, show_timing=False):
+    match = getattr(request, 'resolver_match', None)
+    view_name = match.view_name if match else None
+
+    if show_timing:
+        timing = server_timing(stats, total_seconds)
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+    duplicates = stats.duplicates()
+    fields = {
+        'view': view_name or '-',
+        'method': request.method,
+        'status': response.status_code,
+        'queries': stats.count,
+        'db_ms': round(stats.db_ms, 1),
+        'total_ms': round(total_seconds * 1000, 1),
+        'duplicates': sum(n - 1 for _, n in duplicates),
+    }
+    logger.info(
+        ' '.join(f'{key}={value}' for key, value in fields.items()),
+        extra={'query_stats': fields},
+    )
+
+    budget = budget_for(view_name) if view_name else None
+    if not budget:
+        return
+    over = []
+    if 'queries' in budget and stats.count > budget['queries']:
+        over.append(f"{stats.count} queries > {budget['queries']}")
+    if 'db_ms' in budget and stats.db_ms > budget['db_ms']:
+        over.append(f"{stats.db_ms:.1f}ms in the database > {budget['db_ms']}ms")
+    if over:
+        logger.warning(
+            "Query budget exceeded by %s: %s. Most repeated: %s",
+            view_name, '; '.join(over),
+            ' | '.join(f'{n}x {sql[:200]}' for sql, n in duplicates[:3]) or 'none',
+            extra={'query_stats': fields},
+        )
+
+
+# =========================
+# Middleware
+# =========================
+class QueryStatsMiddleware:
+    """
+    Counts the queries and database time of every request and reports them
+    per resolved view: a log line on the 'Deliver.query_stats' logger, a
+    warning when the view is over its QUERY_BUDGETS entry, and (with DEBUG,
+    or for staff) a Server-Timing header. Works for sync and async views alike.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.query_stats = QueryStats()
+        token = collect(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop(token)
+        elapsed = time.perf_counter() - started
+        report(request, response, stats, elapsed, timing_visible(getattr(request, 'user', None)))
+        return response
+
+    async def __acall__(self, request):
+        stats = request.query_stats = QueryStats()
+        token = collect(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop(token)
+        elapsed = time.perf_counter() - started
+        user = await request.auser() if hasattr(request, 'auser') and not settings.DEBUG else None
+        report(request, response, stats, elapsed, timing_visible(user))
+        return response
@@ -0,0 +1,84 @@
+# Deliver/ratings.py
+from django.db.models import Avg, Count, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Product, ProductRating
+
+
+# =========================
+# Incremental aggregate updates
+# =========================
+def apply_rating_delta(product_id, sum_delta, count_delta):
+    """
+    Shift a product's rating aggregates in a single UPDATE, so concurrent
+    ratings never overwrite each other's contribution.
+    """
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        rating_average=Coalesce(
+            Cast(new_sum, FloatField()) / NullIf(new_count, Value(0)),
+            Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def rating_saved(rating, created, raw=False):
+    stored = getattr(rating, '_stored_rating', None)
+
+    if raw or (not created and (stored is None or None in stored)):
+        # We don't know what was stored before, so recount from scratch
+        recompute_ratings(Product.objects.filter(pk=rating.product_id))
+    elif created:
+        apply_rating_delta(rating.product_id, rating.rating, 1)
+    elif stored[0] != rating.product_id:
+        apply_rating_delta(stored[0], -stored[1], -1)
+        apply_rating_delta(rating.product_id, rating.rating, 1)
+    elif stored[1] != rating.rating:
+        apply_rating_delta(rating.product_id, rating.rating - stored[1], 0)
+
+    rating._stored_rating = (rating.product_id, rating.rating)
+
+
+def rating_deleted(rating):
+    product_id, value = getattr(rating, '_stored_rating', (rating.product_id, rating.rating))
+    apply_rating_delta(product_id, -value, -1)
+
+
+# =========================
+# Backfill / reconcile
+# =========================
+def recompute_ratings(products=None):
+    """
+    Recalculate the aggregates from the ProductRating table.
+    Returns the number of products updated.
+    """
+    if products is None:
+        products = Product.objects.all()
+
+    per_product = ProductRating.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    return products.update(
+        rating_sum=Coalesce(Subquery(per_product.annotate(s=Sum('rating')).values('s')), 0),
+        rating_count=Coalesce(Subquery(per_product.annotate(c=Count('id')).values('c')), 0),
+        rating_average=Coalesce(
+            Subquery(per_product.annotate(a=Avg('rating')).values('a')),
+            Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def find_drift(products=None):
+    """
+    Products whose stored aggregates disagree with the ProductRating table.
+    """
+    if products is None:
+        products = Product.objects.all()
+
+    return products.annotate(
+        actual_sum=Coalesce(Sum('ratings__rating'), 0),
+        actual_count=Count('ratings'),
+    ).exclude(rating_sum=F('actual_sum'), rating_count=F('actual_count'))
@@ -0,0 +1,142 @@
+# Deliver/realtime.py
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+
+# =========================
+# In-process pub/sub
+# =========================
+class Subscription:
+    """
+    One watcher of a channel, bound to the event loop it was created on.
+    Only the newest messages matter (positions, statuses), so when the
+    watcher falls behind the oldest queued message is dropped.
+    """
+
+    def __init__(self, channel, maxsize=16):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, message):
+        # Runs on self.loop
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Hub:
+    """
+    Fans a published message out to every subscriber of a channel.
+
+    Subscribers are async (SSE / long-poll views under ASGI); publishers are
+    usually sync views running in worker threads, so delivery goes through
+    call_soon_threadsafe. This only reaches watchers in the same process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The watcher's loop has closed; it will never read again
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+
+hub = Hub()
+
+
+# =========================
+# Channels
+# =========================
+def location_channel(order_id):
+    return f'order:{order_id}:location'
+
+
+def status_channel(order_id):
+    return f'order:{order_id}:status'
+
+
+def notify_order_status(order_id, status):
+    """
+    Wake everyone long-polling this order's status, once the change is
+    committed (so a woken waiter can never read the old value back).
+    """
+    transaction.on_commit(lambda: hub.publish(status_channel(order_id), {'status': status}))
+
+
+# =========================
+# Server-Sent Events
+# =========================
+def sse_event(data, event=None):
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def sse_stream(subscription, initial=None, keepalive=15, refresh=None, refresh_every=5):
+    """
+    Yield SSE frames for `subscription` until the client disconnects,
+    sending a comment line every `keepalive` seconds to keep proxies open.
+
+    The hub only carries messages published in this process. `refresh`, an
+    async callable returning the current message, is polled after
+    `refresh_every` quiet seconds and sent when it differs from the last
+    frame, so watchers also see updates handled by other workers.
+    """
+    wait = min(keepalive, refresh_every) if refresh else keepalive
+    last = initial
+    idle = 0
+    try:
+        if initial is not None:
+            yield sse_event(initial)
+        while True:
+            try:
+                message = await subscription.get(timeout=wait)
+            except asyncio.TimeoutError:
+                idle += wait
+                message = await refresh() if refresh else None
+                if message is None or message == last:
+                    if idle >= keepalive:
+                        idle = 0
+                        yield ': keepalive\n\n'
+                    continue
+            last = message
+            idle = 0
+            yield sse_event(message)
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,110 @@
+# Deliver/recommendations.py
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+
+from .models import OrderItem, Product, ProductNeighbor, StockReservation
+
+PAID_STATUSES = ('paid', 'delivered')
+
+
+def stored_limit():
+    return getattr(settings, 'RELATED_PRODUCTS_STORED', 20)
+
+
+# =========================
+# Incremental update
+# =========================
+def record_order(order_id):
+    """
+    Count one more co-purchase for every pair of products in a newly sold
+    order, then trim the touched products back to their top neighbours.
+    Called once per order, by inventory.commit or, for orders not paid
+    online, by place_order.
+    """
+    product_ids = sorted(set(
+        OrderItem.objects.filter(order_id=order_id).values_list('product_id', flat=True)
+    ))
+    if len(product_ids) < 2:
+        return
+
+    with transaction.atomic():
+        for product_id in product_ids:
+            others = [other for other in product_ids if other != product_id]
+            ProductNeighbor.objects.filter(product_id=product_id, neighbor_id__in=others).update(
+                score=F('score') + 1
+            )
+            # Pairs seen for the first time; the ones just incremented conflict
+            ProductNeighbor.objects.bulk_create(
+                [ProductNeighbor(product_id=product_id, neighbor_id=other, score=1) for other in others],
+                ignore_conflicts=True,
+            )
+            trim(product_id)
+
+
+def trim(product_id):
+    # Pairs pushed out here can only come back through a rebuild
+    overflow = (
+        ProductNeighbor.objects.filter(product_id=product_id)
+        .order_by('-score', 'neighbor_id')
+        .values_list('id', flat=True)[stored_limit():]
+    )
+    ProductNeighbor.objects.filter(id__in=list(overflow)).delete()
+
+
+# =========================
+# Full rebuild
+# =========================
+def co_purchase_counts():
+    """
+    (product_id, neighbor_id, orders) for every pair bought together in a
+    sold order (paid, or with its stock committed, as cash on delivery
+    orders are when placed), grouped by product with the strongest pairs first.
+    """
+    committed = StockReservation.objects.filter(order_id=OuterRef('order_id'), state='committed')
+    return (
+        OrderItem.objects.filter(Q(order__status__in=PAID_STATUSES) | Exists(committed))
+        .values('product_id', neighbor_id=F('order__items__product_id'))
+        .exclude(neighbor_id=F('product_id'))
+        .annotate(orders=Count('order_id', distinct=True))
+        .order_by('product_id', '-orders', 'neighbor_id')
+        .values_list('product_id', 'neighbor_id', 'orders')
+    )
+
+
+def rebuild(batch_size=1000):
+    """
+    Recompute the whole table from order history, keeping the top
+    RELATED_PRODUCTS_STORED neighbours per product. Returns the row count.
+    """
+    limit = stored_limit()
+    rows = []
+    with transaction.atomic():
+        ProductNeighbor.objects.all().delete()
+        for product_id, pairs in groupby(co_purchase_counts().iterator(), key=lambda row: row[0]):
+            for _, neighbor_id, orders in list(pairs)[:limit]:
+                rows.append(ProductNeighbor(product_id=product_id, neighbor_id=neighbor_id, score=orders))
+        ProductNeighbor.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+# =========================
+# Reading
+# =========================
+def related_products(product, limit=4):
+    """
+    The products most often bought with `product` (one indexed query),
+    topped up from its subcategory while there is little order history.
+    """
+    related = list(
+        Product.objects.filter(neighbor_of__product=product)
+        .order_by('-neighbor_of__score', 'id')[:limit]
+    )
+    if len(related) < limit:
+        related += list(
+            Product.objects.filter(subcategory=product.subcategory)
+            .exclude(id__in=[product.id] + [p.id for p in related])[:limit - len(related)]
+        )
+    return related
@@ -0,0 +1,153 @@
+# Deliver/renditions.py
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import ExifTags, Image, ImageOps, features
+
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+SAVE_OPTIONS = {
+    'webp': {'quality': 80, 'method': 4},
+    'avif': {'quality': 60},
+}
+
+
+def widths():
+    # Covers the 45-200px boxes in the templates at 1x and 2x, plus the detail page
+    return getattr(settings, 'PRODUCT_IMAGE_WIDTHS', (64, 128, 240, 480, 960))
+
+
+def formats():
+    wanted = getattr(settings, 'PRODUCT_IMAGE_FORMATS', ('avif', 'webp'))
+    return [fmt for fmt in wanted if features.check(fmt)]
+
+
+def rendition_name(image_name, width, fmt):
+    stem, _ = os.path.splitext(image_name)
+    return f'renditions/{stem}-{width}w.{fmt}'
+
+
+def manifest_key(image_name):
+    return f'renditions:{image_name}'
+
+
+def source_width(image_name):
+    """The width generate() sees for an upload, or None if it can't be read."""
+    try:
+        with default_storage.open(image_name, 'rb') as source:
+            image = Image.open(source)
+            # EXIF orientations 5-8 are rotated a quarter turn by exif_transpose
+            rotated = image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8)
+            return image.height if rotated else image.width
+    except (OSError, ValueError):
+        return None
+
+
+# =========================
+# Generation
+# =========================
+def generate(image_name, force=False):
+    """
+    Write every rendition of one uploaded image next to MEDIA_ROOT/renditions.
+    Returns the manifest: {format: [widths]}. Never upscales; an image
+    narrower than the smallest width gets a single rendition at its own size.
+    """
+    with default_storage.open(image_name, 'rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    targets = [w for w in widths() if w <= original.width] or [original.width]
+    manifest = {}
+    written = False
+    for fmt in formats():
+        manifest[fmt] = []
+        for width in targets:
+            name = rendition_name(image_name, width, fmt)
+            if force or not default_storage.exists(name):
+                height = round(original.height * width / original.width)
+                resized = original.resize((width, height), Image.Resampling.LANCZOS)
+                buffer = BytesIO()
+                resized.save(buffer, format=fmt.upper(), **SAVE_OPTIONS.get(fmt, {}))
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+                written = True
+            manifest[fmt].append(width)
+
+    cache.set(manifest_key(image_name), manifest, None)
+    if written:
+        # Cached pages still carry the plain <img> fallback for this image
+        page_cache.bump_catalog_version()
+    return manifest
+
+
+def get_manifest(image_name):
+    """
+    Which renditions exist for an image: from the cache, or worked out from
+    storage once (and cached) if the cache was cleared. Empty until generated;
+    an empty answer is cached for RENDITION_MISSING_TIMEOUT seconds, so pages
+    showing images without renditions don't hit storage on every render.
+    """
+    manifest = cache.get(manifest_key(image_name))
+    if manifest is None:
+        manifest = probe_storage(image_name, widths())
+        if not manifest:
+            # A source narrower than every width has one rendition at its own
+            width = source_width(image_name)
+            if width is not None and width < min(widths()):
+                manifest = probe_storage(image_name, [width])
+        timeout = None if manifest else getattr(settings, 'RENDITION_MISSING_TIMEOUT', 60)
+        cache.set(manifest_key(image_name), manifest, timeout)
+    return manifest
+
+
+def probe_storage(image_name, candidates):
+    manifest = {}
+    for fmt in formats():
+        present = [w for w in candidates if default_storage.exists(rendition_name(image_name, w, fmt))]
+        if present:
+            manifest[fmt] = present
+    return manifest
+
+
+# =========================
+# Background pool
+# =========================
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'RENDITION_WORKERS', 2),
+            thread_name_prefix='renditions',
+        )
+    return _executor
+
+
+def _generate_logged(image_name):
+    try:
+        return generate(image_name)
+    except Exception:
+        logger.exception("Could not build renditions for %s", image_name)
+
+
+def schedule(image_name):
+    """
+    Build renditions off the request thread once the upload is committed.
+    """
+    transaction.on_commit(lambda: get_executor().submit(_generate_logged, image_name))
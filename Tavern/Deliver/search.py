@@ -0,0 +1,127 @@
+# Deliver/search.py
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+FTS_TABLE = 'deliver_product_fts'
+
+
+# =========================
+# Backends
+# =========================
+class BasicSearchBackend:
+    """
+    Fallback backend: plain icontains filtering, no ranking.
+    Used on databases without FTS5 support.
+    """
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class SQLiteFTSSearchBackend:
+    """
+    SQLite FTS5 backend. The index lives in a virtual table whose rowid is
+    the product id, so ranked ids can be mapped straight back to products.
+    """
+    # bm25 column weights: a hit in the name counts far more than the description
+    NAME_WEIGHT = 10.0
+    DESCRIPTION_WEIGHT = 1.0
+
+    def __init__(self):
+        self.limit = getattr(settings, 'CATALOG_SEARCH_LIMIT', 500)
+
+    def build_match(self, query):
+        # Every token becomes a quoted prefix term, e.g. 'red win' -> "red"* "win"*
+        tokens = re.findall(r'\w+', query.lower())
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def ranked_ids(self, query, queryset=None):
+        """
+        Ids of the best matches, best first. With `queryset`, only its
+        products are ranked, so the limit applies after its filters.
+        """
+        match = self.build_match(query)
+        if not match:
+            return []
+        scope, scope_params = '', []
+        if queryset is not None:
+            subquery, scope_params = queryset.order_by().values('id').query.sql_with_params()
+            scope = f"AND rowid IN ({subquery}) "
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s {scope}"
+                f"ORDER BY bm25({FTS_TABLE}, %s, %s) LIMIT %s",
+                [match, *scope_params, self.NAME_WEIGHT, self.DESCRIPTION_WEIGHT, self.limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def search(self, queryset, query):
+        ids = self.ranked_ids(query, queryset)
+        if not ids:
+            return queryset.none()
+        ranking = Case(
+            *[When(id=product_id, then=position) for position, product_id in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(id__in=ids).annotate(search_rank=ranking).order_by('search_rank')
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)",
+                [product.id, product.name, product.description or ''],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+    def rebuild(self):
+        table = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+                f'SELECT id, name, description FROM "{table}"'
+            )
+            # Merge the index b-trees after a bulk load
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+            return cursor.fetchone()[0]
+
+
+# =========================
+# Helpers
+# =========================
+def get_backend():
+    backend_path = getattr(settings, 'CATALOG_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSSearchBackend()
+    return BasicSearchBackend()
+
+
+def search_products(queryset, query):
+    """
+    Filter a Product queryset down to matches for `query`, best matches first.
+    """
+    return get_backend().search(queryset, query)
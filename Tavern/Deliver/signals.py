@@ -0,0 +1,104 @@
+# Deliver/signals.py
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cart_summary, navigation, page_cache, query_stats, ratings, renditions, search
+from .models import Cart, CartItem, Category, Product, ProductRating, SubCategory
+
+
+# =========================
+# Search index sync
+# =========================
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.get_backend().index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.get_backend().remove_product(instance.id)
+
+
+# =========================
+# Rating aggregates
+# =========================
+@receiver(post_save, sender=ProductRating)
+def rating_saved(sender, instance, created, raw=False, **kwargs):
+    ratings.rating_saved(instance, created, raw=raw)
+
+
+@receiver(post_delete, sender=ProductRating)
+def rating_deleted(sender, instance, **kwargs):
+    ratings.rating_deleted(instance)
+
+
+# =========================
+# Navigation menu
+# =========================
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_nav(sender, **kwargs):
+    navigation.bump_nav_version()
+
+
+# =========================
+# Cart summaries
+# =========================
+@receiver(post_save, sender=Product)
+def invalidate_carts_for_product(sender, instance, created, **kwargs):
+    # A price change alters the totals of every cart holding the product
+    if not created:
+        cart_ids = CartItem.objects.filter(product=instance).values_list('cart_id', flat=True)
+        cart_summary.invalidate_cart_summary(*cart_ids)
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_carts_for_deleted_product(sender, instance, **kwargs):
+    # Its cart lines are about to be removed by the cascade. This hangs off
+    # Product rather than CartItem so CartItem deletes stay a single query.
+    cart_ids = CartItem.objects.filter(product=instance).values_list('cart_id', flat=True)
+    cart_summary.invalidate_cart_summary(*cart_ids)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def invalidate_user_cart(sender, instance, **kwargs):
+    # The cached user -> cart id lookup must not outlive the cart
+    if instance.user_id is not None:
+        cart_summary.invalidate_user_cart(instance.user_id)
+
+
+# =========================
+# Image renditions
+# =========================
+@receiver(post_save, sender=Product)
+def build_image_renditions(sender, instance, raw=False, **kwargs):
+    # Uploads get a fresh file name, so a missing manifest means a new image
+    if not raw and instance.image and not renditions.get_manifest(instance.image.name):
+        renditions.schedule(instance.image.name)
+
+
+# =========================
+# Anonymous page cache
+# =========================
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_catalog_pages(sender, **kwargs):
+    page_cache.bump_catalog_version()
+
+
+# =========================
+# Query instrumentation
+# =========================
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    query_stats.install(connection)
@@ -0,0 +1,42 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from Deliver import renditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, sizes, alt='', **attrs):
+    """
+    <picture> for an uploaded image, letting the browser pick the smallest
+    pre-generated rendition that fills `sizes`. Falls back to the original
+    upload until the renditions have been built.
+
+        {% picture product.image "200px" alt=product.name class="card-img-top" %}
+    """
+    attributes = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    fallback = format_html('<img src="{}" alt="{}" loading="lazy"{}>', image.url, alt, attributes)
+
+    manifest = renditions.get_manifest(image.name)
+    if not manifest:
+        return fallback
+
+    sources = []
+    for fmt in renditions.formats():
+        if not manifest.get(fmt):
+            continue
+        srcset = ', '.join(
+            f'{default_storage.url(renditions.rendition_name(image.name, width, fmt))} {width}w'
+            for width in manifest[fmt]
+        )
+        sources.append(format_html(
+            '<source type="{}" srcset="{}" sizes="{}">',
+            renditions.MIME_TYPES[fmt], srcset, sizes,
+        ))
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join('', '{}', ((source,) for source in sources)),
+        fallback,
+    )
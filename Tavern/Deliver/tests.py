@@ -1,3 +1,1516 @@
-from django.test import TestCase
+import asyncio
+import cProfile
+import csv
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    benchmark, cart_summary, geo, intasend, inventory, location_store, metrics, navigation, page_cache,
+    payment_events, profiling, query_stats, ratings, recommendations, renditions, search,
+)
+from .catalog_import import CatalogImporter
+from .fake_gateway import FakeIntaSendGateway
+from .intasend import CircuitBreaker, CircuitOpenError, IntaSendClient, IntaSendError
+from .models import (
+    Cart, CartItem, Category, Order, OrderItem, OrderTracking, PaymentEvent, Product, ProductNeighbor,
+    ProductRating, RequestProfile, StockReservation, SubCategory,
+)
+from .orders import EmptyCartError, place_order
+
+
+def make_product(name, **kwargs):
+    kwargs.setdefault('description', '')
+    kwargs.setdefault('price', '1000.00')
+    kwargs.setdefault('image', 'products/test.jpg')
+    return Product.objects.create(name=name, **kwargs)
+
+
+# =========================
+# Catalog search
+# =========================
+class CatalogSearchTests(TestCase):
+
+    def test_prefix_match_and_ranking(self):
+        described = make_product('Four Cousins', description='A sweet red wine')
+        named = make_product('Sweet Red Blend', description='Smooth and fruity')
+        make_product('Dry White', description='Crisp')
+
+        results = list(search.search_products(Product.objects.all(), 'swe re'))
+
+        # Name hits outrank description hits
+        self.assertEqual(results, [named, described])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = make_product('Donelli')
+        product.name = 'Candy Floss'
+        product.save()
+
+        self.assertFalse(search.search_products(Product.objects.all(), 'donelli').exists())
+        self.assertTrue(search.search_products(Product.objects.all(), 'candy').exists())
+
+        product.delete()
+        self.assertEqual(search.get_backend().ranked_ids('candy'), [])
+
+    @override_settings(CATALOG_SEARCH_LIMIT=1)
+    def test_limit_applies_after_the_queryset_filter(self):
+        wines = Category.objects.create(name='Wines', slug='wines')
+        spirits = Category.objects.create(name='Spirits', slug='spirits')
+        make_product('Merlot Merlot', category=spirits)  # ranks first overall
+        in_wines = make_product('Merlot', description='dry', category=wines)
+
+        results = search.search_products(Product.objects.filter(category=wines), 'merlot')
+        self.assertEqual(list(results), [in_wines])
+
+    def test_rebuild(self):
+        make_product('Four Cousins')
+        Product.objects.update(name='Renamed')  # bypasses the signals
+
+        self.assertEqual(search.get_backend().rebuild(), 1)
+        self.assertTrue(search.search_products(Product.objects.all(), 'renamed').exists())
+
+
+# =========================
+# Catalog pagination
+# =========================
+@override_settings(CATALOG_PAGE_SIZE=2)
+class CatalogPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.products = [make_product(f'Wine {i}', price=1000 + i, feature='popular') for i in range(5)]
+
+    def slugs(self, html):
+        return list(dict.fromkeys(re.findall(r'/product/([\w-]+)/', html)))
+
+    def test_pages_do_not_overlap_and_cost_the_same(self):
+        response = self.client.get('/?sort=price')
+        self.assertEqual(list(response.context['products']), self.products[:2])
+
+        seen = [p.slug for p in response.context['products']]
+        cursor = response.context['products'].next_cursor
+        while cursor:
+            with self.assertNumQueries(1):
+                data = self.client.get('/products/more/', {'sort': 'price', 'cursor': cursor}).json()
+            seen += self.slugs(data['html'])
+            cursor = data['next_cursor']
+        self.assertEqual(seen, [p.slug for p in self.products])
+
+    def test_popular_filter_and_search_are_paged(self):
+        response = self.client.get('/?filter=popular')
+        self.assertEqual(len(response.context['products']), 2)
+        self.assertTrue(response.context['products'].has_next)
+
+        page1 = self.client.get('/products/more/', {'q': 'wine'}).json()
+        page2 = self.client.get('/products/more/', {'q': 'wine', 'cursor': page1['next_cursor']}).json()
+        self.assertEqual(len(self.slugs(page2['html'])), 2)
+        self.assertFalse(set(self.slugs(page1['html'])) & set(self.slugs(page2['html'])))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/products/more/', {'cursor': 'garbage'}).status_code, 400)
+        self.assertRedirects(self.client.get('/?cursor=garbage'), '/', fetch_redirect_response=False)
+
+
+# =========================
+# Rating aggregates
+# =========================
+class RatingAggregateTests(TestCase):
+
+    def setUp(self):
+        self.product = make_product('Four Cousins')
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def assertAggregates(self, total, count, average):
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.rating_sum, self.product.rating_count, self.product.rating_average),
+            (total, count, average),
+        )
+
+    def test_create_update_delete(self):
+        ProductRating.objects.create(product=self.product, user=self.alice, rating=5)
+        rating = ProductRating.objects.create(product=self.product, user=self.bob, rating=2)
+        self.assertAggregates(7, 2, 3.5)
+
+        rating = ProductRating.objects.get(pk=rating.pk)
+        rating.rating = 4
+        rating.save()
+        self.assertAggregates(9, 2, 4.5)
+
+        rating.delete()
+        self.assertAggregates(5, 1, 5.0)
+
+        ProductRating.objects.all().delete()
+        self.assertAggregates(0, 0, 0.0)
+
+    def test_rendering_stars_costs_no_query(self):
+        ProductRating.objects.create(product=self.product, user=self.alice, rating=4)
+        product = Product.objects.get(pk=self.product.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual((product.average_rating, product.review_count), (4.0, 1))
+
+    def test_reconcile(self):
+        ProductRating.objects.create(product=self.product, user=self.alice, rating=3)
+        Product.objects.update(rating_sum=0, rating_count=0, rating_average=0)
+        self.assertEqual(list(ratings.find_drift()), [self.product])
+
+        ratings.recompute_ratings()
+        self.assertAggregates(3, 1, 3.0)
+        self.assertFalse(ratings.find_drift().exists())
+
+
+# =========================
+# Navigation menu
+# =========================
+class NavigationCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.wine = Category.objects.create(name='Wine', slug='wine')
+        SubCategory.objects.create(category=self.wine, name='Red', group_name='Varieties')
+        SubCategory.objects.create(category=self.wine, name='Kenya', group_name='Countries')
+
+    def test_tree_is_grouped(self):
+        tree = navigation.get_nav_tree()
+        self.assertEqual(
+            [(group['name'], [sub['slug'] for sub in group['subcategories']]) for group in tree[0]['groups']],
+            [('Countries', ['kenya']), ('Varieties', ['red'])],
+        )
+
+    def test_menu_served_from_cache_until_edited(self):
+        self.client.get('/login/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/login/')
+        self.assertContains(response, 'Kenya')
+
+        SubCategory.objects.create(category=self.wine, name='White', group_name='Varieties')
+        self.assertContains(self.client.get('/login/'), 'White')
+
+
+# =========================
+# Cart summary
+# =========================
+class CartSummaryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.red = make_product('Four Cousins', price='1160.00')
+        self.white = make_product('Donelli', price='580.00')
+
+    def test_summary_from_one_query(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.red, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.white, quantity=1)
+
+        with self.assertNumQueries(1):
+            summary = cart_summary.get_cart_summary(cart.id)
+        with self.assertNumQueries(0):
+            cart_summary.get_cart_summary(cart.id)
+
+        self.assertEqual(summary['item_count'], 3)
+        self.assertEqual(summary['total'], Decimal('2900.00'))
+        self.assertEqual(summary['vat_amount'], Decimal('400.00'))
+
+    def test_cart_views_refresh_summary(self):
+        self.client.post(f'/add-to-cart/{self.red.slug}/')
+        self.client.post(f'/add-to-cart/{self.red.slug}/')
+        self.assertEqual(self.client.get('/cart/').context['cart_total'], Decimal('2320.00'))
+
+        self.client.post(f'/cart/update/{self.red.slug}/', {'action': 'decrease'})
+        self.assertEqual(self.client.get('/cart/').context['cart_total'], Decimal('1160.00'))
+
+        self.red.price = Decimal('1000.00')
+        self.red.save()
+        self.assertEqual(self.client.get('/cart/').context['cart_total'], Decimal('1000.00'))
+
+        self.client.post(f'/cart/remove/{self.red.slug}/')
+        self.assertEqual(self.client.get('/cart/').context['cart_total'], Decimal('0'))
+
+    def test_summary_computed_during_invalidation_is_not_served(self):
+        cart = Cart.objects.create()
+        item = CartItem.objects.create(cart=cart, product=self.red, quantity=1)
+        compute = cart_summary.compute_summary
+
+        def compute_then_change(cart_id):
+            summary = compute(cart_id)
+            item.quantity = 3
+            item.save()
+            cart_summary.invalidate_cart_summary(cart_id)
+            return summary
+
+        cart_summary.compute_summary = compute_then_change
+        self.addCleanup(setattr, cart_summary, 'compute_summary', compute)
+        self.assertEqual(cart_summary.get_cart_summary(cart.id)['item_count'], 1)
+
+        cart_summary.compute_summary = compute
+        self.assertEqual(cart_summary.get_cart_summary(cart.id)['item_count'], 3)
+
+    def test_cached_cart_id_follows_a_replaced_cart(self):
+        user = User.objects.create_user('cart-owner', password='pw')
+        old = Cart.objects.create(user=user)
+        self.client.force_login(user)
+        self.client.get('/')
+
+        old.delete()
+        new = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=new, product=self.white, quantity=2)
+        self.assertEqual(self.client.get('/cart/').context['cart_total'], Decimal('1160.00'))
+
+
+# =========================
+# Order placement
+# =========================
+class PlaceOrderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [make_product(f'Wine {n}', price='100.00', stock=1000) for n in range(100)]
+
+    def fill_cart(self, size):
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=2) for product in self.products[:size]
+        ])
+        return cart
+
+    def test_order_materialized_from_cart(self):
+        cart = self.fill_cart(3)
+        order = place_order(cart, first_name='Harry', phone='0700000000')
+
+        self.assertEqual(order.total_amount, Decimal('600.00'))
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(cart.items.exists())
+        with self.assertRaises(EmptyCartError):
+            place_order(cart)
+
+    def test_transaction_statements_stay_flat(self):
+        """
+        The statements issued inside the checkout transaction must not grow
+        with the cart, so neither does the time the write lock is held.
+        """
+        statements = {}
+        for size in (1, 10, 100):
+            cart = self.fill_cart(size)
+            with CaptureQueriesContext(connection) as queries:
+                place_order(cart)
+            statements[size] = len(queries)
+
+        self.assertEqual(statements[1], statements[10])
+        self.assertEqual(statements[1], statements[100])
+        self.assertEqual(Order.objects.count(), 3)
+
+
+# =========================
+# Stock reservation
+# =========================
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.wine = make_product('Wine', stock=5)
+        self.beer = make_product('Beer', stock=1)
+
+    def checkout(self, *lines):
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=p, quantity=q) for p, q in lines])
+        return place_order(cart)
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.stock
+
+    def test_all_lines_or_nothing(self):
+        with self.assertRaises(inventory.OutOfStockError) as raised:
+            self.checkout((self.wine, 2), (self.beer, 2))
+        self.assertEqual(raised.exception.products, [self.beer])
+        self.assertEqual((self.stock(self.wine), self.stock(self.beer)), (5, 1))
+        self.assertFalse(Order.objects.exists())
+
+        order = self.checkout((self.wine, 2), (self.beer, 1))
+        self.assertEqual((self.stock(self.wine), self.stock(self.beer)), (3, 0))
+        self.assertEqual(order.reservations.filter(state='held').count(), 2)
+
+    def test_failed_payment_releases_and_success_commits(self):
+        failed = self.checkout((self.wine, 2))
+        paid = self.checkout((self.wine, 1))
+        for order, state in ((failed, 'FAILED'), (paid, 'COMPLETE')):
+            payment_events.record_event({'invoice_id': f'INV-{order.id}', 'api_ref': f'ORDER-{order.id}',
+                                         'state': state})
+        payment_events.drain()
+        payment_events.drain()  # a replayed failure cannot return the stock twice
+        inventory.release_order(failed.id)
+
+        self.assertEqual(self.stock(self.wine), 4)
+        self.assertEqual(failed.reservations.get().state, 'released')
+        self.assertEqual(paid.reservations.get().state, 'committed')
+
+    def test_expired_holds_are_released(self):
+        order = self.checkout((self.wine, 3))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('release_expired_reservations', stdout=StringIO())
+        self.assertEqual(self.stock(self.wine), 5)
+
+        # Paying late takes the stock again while it lasts
+        inventory.commit(order.id)
+        self.assertEqual(self.stock(self.wine), 2)
+
+    def test_cash_on_delivery_orders_keep_their_stock(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.wine, quantity=3)
+        session = self.client.session
+        session['cart_id'] = cart.id
+        session.save()
+
+        self.client.post('/checkout/', {'payment': 'cod'})
+        order = Order.objects.get()
+        self.assertEqual(order.reservations.get().state, 'committed')
+
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(inventory.release_expired(), 0)
+        self.assertEqual(self.stock(self.wine), 2)
+
+    def test_checkout_view_reports_shortage(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.beer, quantity=3)
+        session = self.client.session
+        session['cart_id'] = cart.id
+        session.save()
+
+        response = self.client.post('/checkout/', {'payment': 'cod'}, follow=True)
+        self.assertRedirects(response, '/cart/')
+        self.assertEqual([str(m) for m in response.context['messages']], ['Only 1 Beer left in stock.'])
+        self.assertEqual(cart.items.count(), 1)
+
+
+class StockStressTests(TransactionTestCase):
+    """
+    Many checkouts racing for the same few bottles, each on its own
+    connection: exactly the stock on hand may be sold, never more.
+    """
+
+    def test_parallel_checkouts_never_oversell(self):
+        wine = make_product('Wine', stock=10, image='')
+        beer = make_product('Beer', stock=25, image='')
+        carts = []
+        for _ in range(40):
+            cart = Cart.objects.create()
+            CartItem.objects.bulk_create([CartItem(cart=cart, product=wine, quantity=1),
+                                          CartItem(cart=cart, product=beer, quantity=1)])
+            carts.append(cart)
+
+        outcomes = []
+        start = threading.Barrier(len(carts))
+
+        def buy(cart):
+            start.wait()
+            try:
+                for attempt in range(100):
+                    try:
+                        place_order(cart)
+                        outcomes.append('sold')
+                        return
+                    except inventory.OutOfStockError:
+                        outcomes.append('refused')
+                        return
+                    except OperationalError:
+                        # SQLite lets one writer in at a time: back off and retry
+                        time.sleep(random.uniform(0, min(0.5, 0.005 * 2 ** attempt)))
+                outcomes.append('gave up')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        wine.refresh_from_db()
+        beer.refresh_from_db()
+        self.assertEqual(outcomes.count('sold'), 10)
+        self.assertEqual(outcomes.count('refused'), 30)
+        self.assertEqual((wine.stock, beer.stock), (0, 15))
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(sum(StockReservation.objects.filter(product=wine).values_list('quantity', flat=True)), 10)
+
+
+# =========================
+# Order history
+# =========================
+@override_settings(ORDER_HISTORY_PAGE_SIZE=5)
+class OrderHistoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.products = [make_product(f'Wine {n}') for n in range(3)]
+        self.client.force_login(self.user)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, total_amount='3000.00')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, price='1000.00')
+                for product in self.products
+            ])
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/orders/', params)
+        return response, len(queries)
+
+    def test_query_count_independent_of_history(self):
+        self.add_orders(2)
+        self.count_queries()  # warm the menu and cart caches
+        _, small = self.count_queries()
+        self.add_orders(40)
+        _, large = self.count_queries()
+        self.assertEqual(small, large)
+
+    def test_pages_and_rated_flags(self):
+        self.add_orders(7)
+        ProductRating.objects.create(product=self.products[0], user=self.user, rating=4)
+
+        first, _ = self.count_queries()
+        orders = first.context['orders']
+        self.assertEqual(len(orders), 5)
+        flags = [item.rated_by_user for item in orders.object_list[0].items.all()]
+        self.assertEqual(sorted(flags), [False, False, True])
+
+        second, _ = self.count_queries(cursor=orders.next_cursor)
+        older = second.context['orders']
+        self.assertEqual(len(older), 2)
+        self.assertFalse(older.has_next)
+        seen = [o.id for o in orders] + [o.id for o in older]
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+
+# =========================
+# Live driver location
+# =========================
+class DriverLocationStreamTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def ping(self, order_id, lat, lng, status='on_the_way'):
+        return self.client.post(
+            f'/update-location/{order_id}/',
+            json.dumps({'latitude': lat, 'longitude': lng, 'status': status}),
+            content_type='application/json',
+        )
+
+    async def test_stream_pushes_only_changes(self):
+        user = await User.objects.acreate(username='alice')
+        order = await Order.objects.acreate(user=user, total_amount='1000.00')
+        await OrderTracking.objects.acreate(order=order, driver_latitude='-1.286389', driver_longitude='36.817223')
+        await self.async_client.aforce_login(user)
+
+        response = await self.async_client.get(f'/driver-location/{order.id}/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+
+        first = await asyncio.wait_for(anext(stream), 1)
+        self.assertIn(b'"lat": -1.286389', first)
+
+        # Unchanged fix (the snapshot's position) then a real move
+        await sync_to_async(self.ping)(order.id, -1.286389, 36.817223, 'assigned')
+        await sync_to_async(self.ping)(order.id, -1.3, 36.8)
+
+        pushed = await asyncio.wait_for(anext(stream), 1)
+        self.assertIn(b'"lat": -1.3', pushed)
+        self.assertIn(b'on_the_way', pushed)
+        await stream.aclose()
+
+    @override_settings(DRIVER_LOCATION_STREAM_REFRESH=0.05)
+    async def test_stream_picks_up_pings_handled_by_other_workers(self):
+        user = await User.objects.acreate(username='alice')
+        order = await Order.objects.acreate(user=user, total_amount='1000.00')
+        await OrderTracking.objects.acreate(order=order, driver_latitude='-1.286389', driver_longitude='36.817223')
+        await self.async_client.aforce_login(user)
+
+        response = await self.async_client.get(f'/driver-location/{order.id}/stream/')
+        stream = aiter(response.streaming_content)
+        await asyncio.wait_for(anext(stream), 1)
+
+        # Another process moved the driver: nothing is published on this hub
+        await OrderTracking.objects.filter(order=order).aupdate(driver_latitude='-1.5')
+        await sync_to_async(cache.delete)(location_store.location_key(order.id))
+
+        pushed = await asyncio.wait_for(anext(stream), 1)
+        self.assertIn(b'"lat": -1.5', pushed)
+        await stream.aclose()
+
+    def test_wsgi_requests_fall_back_to_polling(self):
+        self.assertEqual(self.client.get('/driver-location/1/stream/').status_code, 204)
+
+    @override_settings(DRIVER_LOCATION_FLUSH_INTERVAL=3600, DRIVER_LOCATION_WRITE_BEHIND=True)
+    def test_pings_are_written_behind(self):
+        order = Order.objects.create(total_amount='1000.00')
+
+        # No tracking row yet: the first ping creates it instead of crashing
+        self.ping(order.id, -1.1, 36.1, 'picked')
+        tracking = OrderTracking.objects.get(order=order)
+        self.assertEqual(tracking.status, 'picked')
+
+        with self.assertNumQueries(0):
+            self.ping(order.id, -1.2, 36.2, 'picked')
+            self.ping(order.id, -1.3, 36.3, 'picked')
+            response = self.client.get(f'/driver-location/{order.id}/')
+        self.assertEqual(response.json(), {'lat': -1.3, 'lng': 36.3, 'status': 'picked'})
+
+        tracking.refresh_from_db()
+        self.assertEqual(tracking.driver_latitude, Decimal('-1.100000'))
+
+        # A status change is flushed immediately
+        self.ping(order.id, -1.4, 36.4, 'arriving')
+        tracking.refresh_from_db()
+        self.assertEqual((tracking.driver_latitude, tracking.status), (Decimal('-1.400000'), 'arriving'))
+
+    def test_unknown_order_is_404(self):
+        self.assertEqual(self.ping(999, -1.1, 36.1).status_code, 404)
+
+    @override_settings(DRIVER_LOCATION_FLUSH_INTERVAL=3600)
+    def test_per_process_cache_writes_through(self):
+        order = Order.objects.create(total_amount='1000.00')
+        self.assertFalse(location_store.write_behind())  # LocMem in tests
+
+        for i in range(10):
+            self.ping(order.id, -1.1 - i * 0.01, 36.1, 'picked')
+        # Every position reaches OrderTracking; the route is still buffered
+        tracking = OrderTracking.objects.get(order=order)
+        self.assertEqual(tracking.driver_latitude, Decimal('-1.190000'))
+        self.assertEqual(order.location_chunks.count(), 1)  # the status change on the first ping
+        self.assertFalse(cache.get(location_store.location_key(order.id))['dirty'])
+
+        self.ping(order.id, -1.2, 36.1, 'on_the_way')
+        self.assertEqual(order.location_chunks.count(), 2)
+        route = location_store.route_points(order.id)
+        self.assertEqual((route[0][1], route[-1][1]), (-1_100_000, -1_200_000))
+
+    @override_settings(DRIVER_LOCATION_FLUSH_INTERVAL=0)
+    def test_write_through_entry_rereads_position_from_other_workers(self):
+        order = Order.objects.create(total_amount='1000.00')
+        self.ping(order.id, -1.1, 36.1, 'picked')
+        # Another worker took a later ping
+        OrderTracking.objects.filter(order=order).update(driver_latitude='-1.500000', status='arriving')
+        self.assertEqual(location_store.get_location(order.id)['status'], 'arriving')
+
+
+# =========================
+# Route history
+# =========================
+class RouteHistoryTests(TestCase):
+
+    def test_encoding_round_trip_is_compact(self):
+        start = 1_760_000_000_000
+        points = [(start + i * 3000, -1_286_389 + i * 40, 36_817_223 - i * 25) for i in range(200)]
+        data = geo.encode_points(points, start)
+
+        self.assertEqual(geo.decode_points(data, start), points)
+        self.assertLess(len(data) / len(points), 8)
+
+    def test_douglas_peucker_keeps_corners(self):
+        # An L-shaped route sampled every ~11m: only the three corners matter
+        leg = [(i, -1_280_000 + i * 100, 36_800_000) for i in range(51)]
+        turn = [(50 + i, -1_275_000, 36_800_000 + i * 100) for i in range(1, 50)]
+        simplified = geo.douglas_peucker(leg + turn, tolerance_m=5)
+
+        self.assertEqual(simplified, [leg[0], leg[-1], turn[-1]])
+
+    def test_time_bucket(self):
+        points = [(t * 1000, 0, 0) for t in range(10)]
+        self.assertEqual([p[0] for p in geo.time_bucket(points, 4)], [0, 3000, 7000, 9000])
+
+    @override_settings(DRIVER_LOCATION_FLUSH_INTERVAL=3600, DRIVER_TRACK_MAX_BUFFER=10,
+                       DRIVER_LOCATION_WRITE_BEHIND=True)
+    def test_route_endpoint_combines_chunks_and_live_pings(self):
+        cache.clear()
+        user = User.objects.create_user('alice')
+        order = Order.objects.create(user=user, total_amount='1000.00')
+        for i in range(15):
+            location_store.record_ping(order.id, -1.28 + i * 0.001, 36.8, 'on_the_way')
+
+        # Flushed on the first ping (status change) and when the buffer filled
+        self.assertEqual(order.location_chunks.count(), 2)
+        self.client.force_login(user)
+        route = self.client.get(f'/driver-route/{order.id}/').json()
+
+        # A straight line collapses to its two ends; distance uses every point
+        self.assertEqual(route['points'], [[-1.28, 36.8], [-1.266, 36.8]])
+        self.assertAlmostEqual(route['distance_m'], 1557, delta=5)
+        self.assertTrue(route['polyline'])
+
+        User.objects.create_user('mallory')
+        self.client.force_login(User.objects.get(username='mallory'))
+        self.assertEqual(self.client.get(f'/driver-route/{order.id}/').status_code, 404)
+
+
+# =========================
+# Payment status long-poll
+# =========================
+class PaymentStatusWaitTests(TestCase):
+
+    def complete_payment(self, order_id):
+        with override_settings(PAYMENT_EVENTS_INLINE_WORKER=False):
+            self.client.post(
+                '/intasend/webhook/',
+                json.dumps({'api_ref': f'ORDER-{order_id}', 'state': 'COMPLETE'}),
+                content_type='application/json',
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            payment_events.drain()
+
+    async def test_waiter_is_woken_by_webhook(self):
+        order = await Order.objects.acreate(total_amount='1000.00')
+        url = f'/checkout/intasend/status/{order.id}/wait/'
+
+        waiter = asyncio.ensure_future(self.async_client.get(url, {'status': 'pending'}))
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiter.done())
+
+        await sync_to_async(self.complete_payment)(order.id)
+        response = await asyncio.wait_for(waiter, 2)
+        self.assertEqual(response.json(), {'status': 'paid'})
+
+    async def test_returns_immediately_when_status_already_moved(self):
+        order = await Order.objects.acreate(total_amount='1000.00', status='paid')
+        response = await self.async_client.get(
+            f'/checkout/intasend/status/{order.id}/wait/', {'status': 'pending'}
+        )
+        self.assertEqual(response.json(), {'status': 'paid'})
+
+    async def test_times_out_with_unchanged_status(self):
+        order = await Order.objects.acreate(total_amount='1000.00')
+        response = await self.async_client.get(
+            f'/checkout/intasend/status/{order.id}/wait/', {'status': 'pending', 'timeout': '0.05'}
+        )
+        self.assertEqual(response.json(), {'status': 'pending'})
+
+    @override_settings(PAYMENT_STATUS_RECHECK=0.05)
+    async def test_waiter_rereads_changes_made_by_other_workers(self):
+        order = await Order.objects.acreate(total_amount='1000.00')
+        url = f'/checkout/intasend/status/{order.id}/wait/'
+
+        waiter = asyncio.ensure_future(self.async_client.get(url, {'status': 'pending'}))
+        await asyncio.sleep(0.05)
+        # Written without notifying this process's hub
+        await Order.objects.filter(id=order.id).aupdate(status='paid')
+        response = await asyncio.wait_for(waiter, 2)
+        self.assertEqual(response.json(), {'status': 'paid'})
+
+    @override_settings(PAYMENT_STATUS_RECHECK=3)
+    def test_wsgi_answers_without_waiting(self):
+        order = Order.objects.create(total_amount='1000.00')
+        started = time.monotonic()
+        response = self.client.get(f'/checkout/intasend/status/{order.id}/wait/', {'status': 'pending'})
+        self.assertEqual(response.json(), {'status': 'pending'})
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response['Retry-After'], '3')
+
+
+# =========================
+# IntaSend client
+# =========================
+class IntaSendClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.gateway = FakeIntaSendGateway().start()
+        self.addCleanup(self.gateway.stop)
+
+    def make_client(self, **kwargs):
+        kwargs.setdefault('backoff', 0)
+        client = IntaSendClient('secret', self.gateway.url, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def push(self, client):
+        return client.stk_push(1500, '254700000000', 'ORDER-1', 'http://testserver/intasend/webhook/')
+
+    def test_stk_push(self):
+        result = self.push(self.make_client())
+
+        self.assertTrue(result.ok)
+        path, payload = self.gateway.requests[0]
+        self.assertEqual(path, '/api/v1/payment/mpesa-stk-push/')
+        self.assertEqual(payload['api_ref'], 'ORDER-1')
+
+    def test_unavailable_gateway_is_retried(self):
+        self.gateway.respond(503)
+        self.gateway.respond(503)
+        self.assertTrue(self.push(self.make_client(retries=2)).ok)
+        self.assertEqual(len(self.gateway.requests), 3)
+
+    def test_retry_after_is_capped(self):
+        self.gateway.respond(503, headers={'Retry-After': '120'})
+        started = time.monotonic()
+        self.assertTrue(self.push(self.make_client(max_retry_after=0.1)).ok)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(len(self.gateway.requests), 2)
+
+    def test_error_from_a_non_object_body(self):
+        self.gateway.respond(400, ['Invalid phone number'])
+        result = self.push(self.make_client())
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error, "Request failed. Verify your phone number.")
+
+    def test_bad_gateway_is_not_retried(self):
+        # The push may have gone through behind the proxy
+        self.gateway.respond(502)
+        self.assertEqual(self.push(self.make_client(retries=2)).status_code, 502)
+        self.assertEqual(len(self.gateway.requests), 1)
+
+    def test_read_timeout_is_not_retried(self):
+        self.gateway.respond(201, delay=0.5)
+        with self.assertRaises(IntaSendError):
+            self.push(self.make_client(timeout=(1, 0.1)))
+        self.assertEqual(len(self.gateway.requests), 1)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        client = self.make_client(retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        self.gateway.default = (500, {})
+        self.push(client)
+        self.push(client)
+
+        with self.assertRaises(CircuitOpenError):
+            self.push(client)
+        self.assertEqual(len(self.gateway.requests), 2)
+
+    async def test_async_push(self):
+        result = await self.make_client().astk_push(1500, '254700000000', 'ORDER-2', 'http://testserver/')
+        self.assertTrue(result.ok)
+
+
+class IntaSendPaymentViewTests(TestCase):
+
+    def setUp(self):
+        self.gateway = FakeIntaSendGateway().start()
+        self.addCleanup(self.gateway.stop)
+        client = IntaSendClient('secret', self.gateway.url, backoff=0)
+        self.addCleanup(client.close)
+        intasend._client = client
+        self.addCleanup(setattr, intasend, '_client', None)
+
+    async def test_stk_push_from_async_view(self):
+        order = await Order.objects.acreate(total_amount='1500.00')
+        response = await self.async_client.post(f'/checkout/intasend/{order.id}/', {'phone': '254700000000'})
+
+        self.assertRedirects(response, f'/checkout/payment-wait/{order.id}/', fetch_redirect_response=False)
+        await order.arefresh_from_db()
+        self.assertEqual(order.status, 'payment_initiated')
+        self.assertEqual(self.gateway.requests[0][1]['api_ref'], f'ORDER-{order.id}')
+
+    def test_a_paid_order_is_not_downgraded(self):
+        order = Order.objects.create(total_amount='1500.00')
+        # The callback is applied while the STK push is still in flight
+        self.gateway.default = (201, {'invoice': {'state': 'PENDING'}})
+        Order.objects.filter(id=order.id).update(status='paid')
+        self.client.post(f'/checkout/intasend/{order.id}/', {'phone': '254700000000'})
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+
+    def test_gateway_error_returns_to_the_form(self):
+        order = Order.objects.create(total_amount='1500.00')
+        self.gateway.default = (400, {'errors': 'Invalid phone'})
+        response = self.client.post(f'/checkout/intasend/{order.id}/', {'phone': '1'})
+
+        self.assertRedirects(response, f'/checkout/intasend/{order.id}/', fetch_redirect_response=False)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+
+
+# =========================
+# Payment webhook queue
+# =========================
+@override_settings(PAYMENT_EVENTS_INLINE_WORKER=False)
+class PaymentEventTests(TestCase):
+
+    def setUp(self):
+        self.order = Order.objects.create(total_amount='1000.00', status='payment_initiated')
+
+    def callback(self, state, invoice='INV-1'):
+        return self.client.post(
+            '/intasend/webhook/',
+            json.dumps({'invoice_id': invoice, 'api_ref': f'ORDER-{self.order.id}', 'state': state}),
+            content_type='application/json',
+        )
+
+    def test_webhook_only_appends(self):
+        with self.assertNumQueries(1):
+            response = self.callback('COMPLETE')
+        self.assertEqual(response.status_code, 200)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'payment_initiated')
+
+    def test_retries_are_deduplicated(self):
+        for _ in range(3):
+            self.assertEqual(self.callback('COMPLETE').status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+
+        self.assertEqual(payment_events.drain(), 1)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_late_failure_cannot_undo_payment(self):
+        self.callback('COMPLETE')
+        self.callback('FAILED')
+        payment_events.drain()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_garbage_is_rejected_and_unknown_orders_ignored(self):
+        self.assertEqual(
+            self.client.post('/intasend/webhook/', 'nope', content_type='application/json').status_code,
+            400,
+        )
+        self.client.post(
+            '/intasend/webhook/',
+            json.dumps({'api_ref': 'ORDER-999', 'state': 'COMPLETE'}),
+            content_type='application/json',
+        )
+        self.assertEqual(payment_events.drain(), 1)
+
+    def test_a_failing_event_does_not_hold_up_the_batch(self):
+        apply_event = payment_events.apply_event
+
+        def flaky_apply(event):
+            if event.reference == 'INV-Y':
+                raise RuntimeError("gateway sent nonsense")
+            return apply_event(event)
+        payment_events.apply_event = flaky_apply
+        self.addCleanup(setattr, payment_events, 'apply_event', apply_event)
+
+        PaymentEvent.objects.create(reference='INV-X', state='COMPLETE', payload={'api_ref': ['ORDER-1']})
+        PaymentEvent.objects.create(reference='INV-Y', state='COMPLETE', payload={'api_ref': 'ORDER-1'})
+        self.callback('COMPLETE')
+
+        with self.assertLogs('Deliver.payment_events', 'ERROR'):
+            self.assertEqual(payment_events.drain(), 3)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(list(PaymentEvent.objects.exclude(error='').values_list('reference', 'error')),
+                         [('INV-Y', 'RuntimeError: gateway sent nonsense')])
+
+
+# =========================
+# Anonymous page cache
+# =========================
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = make_product('Tusker Lager')
+
+    def test_anonymous_pages_are_cached_until_catalog_changes(self):
+        url = f'/product/{self.product.slug}/'
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Tusker Lager')
+
+        self.product.name = 'Tusker Malt'
+        self.product.save()
+        self.assertContains(self.client.get(url), 'Tusker Malt')
+
+    def test_key_ignores_unrelated_parameters(self):
+        self.client.get('/?filter=popular')
+        self.assertEqual(self.client.get('/?utm_source=x&filter=popular')['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'miss')
+
+    def test_csrf_token_is_filled_in_per_visitor(self):
+        self.client.get('/')
+        response = self.client.get('/')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertNotContains(response, page_cache.CSRF_PLACEHOLDER)
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_signed_in_users_and_full_carts_bypass_the_cache(self):
+        self.client.get('/')
+        self.client.get(f'/add-to-cart/{self.product.slug}/')
+        self.assertFalse(self.client.get('/').has_header('X-Page-Cache'))
+
+        self.client.force_login(User.objects.create_user('wanjiku', password='x'))
+        self.assertFalse(self.client.get('/').has_header('X-Page-Cache'))
+
+
+# =========================
+# Recommendations
+# =========================
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.wine, self.cheese, self.crackers, self.beer = (
+            make_product(name) for name in ('Wine', 'Cheese', 'Crackers', 'Beer')
+        )
+
+    def make_order(self, *products, status='pending'):
+        order = Order.objects.create(total_amount='1000.00', status=status)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price) for product in products
+        ])
+        return order
+
+    def test_paid_orders_update_neighbours(self):
+        for products in [(self.wine, self.cheese), (self.wine, self.cheese, self.crackers)]:
+            order = self.make_order(*products, status='payment_initiated')
+            payment_events.record_event({'invoice_id': f'INV-{order.id}', 'api_ref': f'ORDER-{order.id}',
+                                         'state': 'COMPLETE'})
+        payment_events.drain()
+
+        self.assertEqual(ProductNeighbor.objects.get(product=self.wine, neighbor=self.cheese).score, 2)
+        with self.assertNumQueries(1):
+            related = recommendations.related_products(self.wine, limit=2)
+        self.assertEqual(related, [self.cheese, self.crackers])
+
+    def test_cash_and_admin_settled_orders_update_neighbours(self):
+        Product.objects.update(stock=10)
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.wine, quantity=1)
+        CartItem.objects.create(cart=cart, product=self.beer, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            cash = place_order(cart, pay_online=False, first_name='Harry')
+        self.assertEqual(ProductNeighbor.objects.get(product=self.wine, neighbor=self.beer).score, 1)
+        recommendations.rebuild()  # still pending, but sold
+        self.assertEqual(ProductNeighbor.objects.get(product=self.wine, neighbor=self.beer).score, 1)
+
+        CartItem.objects.create(cart=cart, product=self.wine, quantity=1)
+        CartItem.objects.create(cart=cart, product=self.beer, quantity=1)
+        online = place_order(cart, first_name='Harry')
+
+        staff = User.objects.create_superuser('manager', password='pw')
+        self.client.force_login(staff)
+        for order in (online, cash):  # the cash order was counted when placed
+            form = {'total_amount': order.total_amount, 'status': 'delivered', 'first_name': 'Harry'}
+            response = self.client.post(f'/admin/Deliver/order/{order.id}/change/', form)
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(ProductNeighbor.objects.get(product=self.wine, neighbor=self.beer).score, 2)
+        self.assertFalse(StockReservation.objects.filter(order=online, state='held').exists())
+
+        recommendations.rebuild()
+        self.assertEqual(ProductNeighbor.objects.get(product=self.wine, neighbor=self.beer).score, 2)
+
+    @override_settings(RELATED_PRODUCTS_STORED=1)
+    def test_rebuild_matches_history_and_keeps_top_k(self):
+        self.make_order(self.wine, self.cheese, status='paid')
+        self.make_order(self.wine, self.cheese, status='delivered')
+        self.make_order(self.wine, self.crackers, status='paid')
+        self.make_order(self.wine, self.beer)  # never paid
+
+        recommendations.rebuild()
+        self.assertEqual(
+            list(ProductNeighbor.objects.filter(product=self.wine).values_list('neighbor__name', 'score')),
+            [('Cheese', 2)],
+        )
+
+    def test_falls_back_to_subcategory(self):
+        self.assertEqual(len(recommendations.related_products(self.wine, limit=4)), 3)
+
+
+# =========================
+# Query plans
+# =========================
+class QueryPlanTests(TestCase):
+
+    def test_views_use_indexes(self):
+        out = StringIO()
+        call_command('check_query_plans', stdout=out, stderr=out)
+        self.assertIn('No full table scans.', out.getvalue())
+        self.assertFalse(Category.objects.filter(slug='plan-check').exists())
+
+
+# =========================
+# Database profile
+# =========================
+class DatabaseWriteBenchmarkTests(SimpleTestCase):
+
+    def test_wal_profile_takes_concurrent_writes(self):
+        out = StringIO()
+        call_command('bench_db_writes', threads=4, ops=25, stdout=out)
+        wal = next(line for line in out.getvalue().splitlines() if line.startswith('SQLite (WAL profile)'))
+        self.assertTrue(wal.endswith('errors 0'), wal)
+
+
+# =========================
+# Query instrumentation
+# =========================
+class QueryStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        self.assertEqual(
+            query_stats.fingerprint("SELECT * FROM t WHERE id = 5 AND name = 'x''y' AND k IN (%s, %s,%s)"),
+            'SELECT * FROM t WHERE id = ? AND name = ? AND k IN (...)',
+        )
+
+    def test_header_log_line_and_budget(self):
+        category = Category.objects.create(name='Wine')
+        for n in range(3):
+            make_product(f'Wine {n}', category=category, stock=5)
+
+        with self.assertLogs('Deliver.query_stats', 'INFO') as logs, \
+                override_settings(QUERY_BUDGETS={'product_list': {'queries': 1}}):
+            response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)  # only for staff
+        self.assertRegex(logs.output[0], r'view=product_list method=GET status=200 queries=\d+')
+        self.assertIn('Query budget exceeded by product_list', logs.output[1])
+
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        response = self.client.get('/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", app;dur=')
+
+    async def test_async_view_queries_are_counted(self):
+        order = await Order.objects.acreate(total_amount='1000.00', status='paid')
+        await self.async_client.aforce_login(await User.objects.acreate(username='ops', is_staff=True))
+        response = await self.async_client.get(
+            f'/checkout/intasend/status/{order.id}/wait/', {'status': 'pending'}
+        )
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+# =========================
+# Request profiling
+# =========================
+class RequestProfileTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        make_product('Gin', stock=5)
+
+    def test_signed_header_profiles_the_request(self):
+        self.client.get('/cart/', HTTP_X_PROFILE='forged')
+        self.assertFalse(RequestProfile.objects.exists())
+
+        self.client.get('/', HTTP_X_PROFILE=profiling.make_token())
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.view_name, profile.trigger, profile.status_code), ('product_list', 'header', 200))
+        self.assertGreater(profile.query_count, 0)
+        self.assertIn('product_list', profiling.summary(bytes(profile.pstats)))
+
+    async def test_sync_views_are_profiled_under_asgi(self):
+        response = await self.async_client.get('/cart/', headers={'X-Profile': profiling.make_token()})
+        self.assertEqual(response.status_code, 200)
+        profile = await RequestProfile.objects.aget()
+        self.assertEqual((profile.view_name, profile.trigger), ('cart', 'header'))
+        self.assertIn('cart', profiling.summary(bytes(profile.pstats)))
+
+    def test_busy_profiler_runs_the_request_unprofiled(self):
+        other = cProfile.Profile()
+        other.enable()  # Python 3.12+ refuses a second one; older versions allow it
+        try:
+            response = self.client.get('/cart/', HTTP_X_PROFILE=profiling.make_token())
+        finally:
+            other.disable()
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(RequestProfile.objects.count(), 1)
+
+    @override_settings(PROFILER='sampler', PROFILE_SAMPLE_INTERVAL=0.001, PROFILE_KEEP=3)
+    def test_admin_toggle_sampler_and_download(self):
+        admin = User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.post('/admin/Deliver/requestprofile/toggle/', {'enable': '1'}, follow=True)
+        # LocMem in tests: the admin is told the toggle covers one process
+        self.assertContains(response, 'only this one is profiling')
+        for _ in range(3):
+            self.client.get('/product/gin/')
+        self.client.post('/admin/Deliver/requestprofile/toggle/')
+        self.client.get('/product/gin/')
+
+        profiles = RequestProfile.objects.filter(path='/product/gin/')
+        # Trimmed to PROFILE_KEEP; the POST switching it off is the third
+        self.assertEqual(profiles.count(), 2)
+        profile = profiles.exclude(collapsed='').first()
+        self.assertEqual(profile.trigger, 'toggle')
+        self.assertContains(self.client.get('/admin/Deliver/requestprofile/'), '/product/gin/')
+
+        response = self.client.get(f'/admin/Deliver/requestprofile/{profile.pk}/download/folded/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+
+# =========================
+# Metrics
+# =========================
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def scrape(self):
+        return self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+    def value(self, line_prefix):
+        for line in self.scrape().content.decode().splitlines():
+            if line.startswith(line_prefix + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_requests_cache_and_business_counters(self):
+        make_product('Gin', stock=5)
+        order = Order.objects.create(total_amount='1000.00')
+        views = 'tavern_http_request_duration_seconds_count{view="product_list",method="GET"}'
+        misses = 'tavern_cache_lookups_total{cache="page",result="miss"}'
+        paid = 'tavern_payments_total{outcome="completed"}'
+        pings = 'tavern_driver_pings_total'
+        before = {name: self.value(name) for name in (views, misses, paid, pings)}
+
+        self.client.get('/')
+        with override_settings(PAYMENT_EVENTS_INLINE_WORKER=False):
+            for _ in range(2):  # a retried delivery is not a second payment
+                self.client.post('/intasend/webhook/',
+                                 json.dumps({'api_ref': f'ORDER-{order.id}', 'state': 'COMPLETE'}),
+                                 content_type='application/json')
+            self.assertEqual(self.value(paid), before[paid])  # counted when applied
+        with self.captureOnCommitCallbacks(execute=True):
+            payment_events.drain()
+        self.client.post(f'/update-location/{order.id}/', json.dumps({'latitude': -1.28, 'longitude': 36.82}),
+                         content_type='application/json')
+
+        for name in (views, misses, paid, pings):
+            self.assertEqual(self.value(name), before[name] + 1, name)
+        response = self.scrape()
+        self.assertContains(response, '# TYPE tavern_http_request_duration_seconds histogram')
+        self.assertContains(response, 'tavern_http_requests_in_flight 1')  # the scrape itself
+
+    def test_token_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.scrape().status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_staff_only_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_thread_shards_survive_their_threads(self):
+        counter = metrics.Counter('tavern_test_shards_total', "Test only.")
+        self.addCleanup(metrics.registry.metrics.pop, counter.name)
+        threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(1000)]) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        del threads, thread
+        self.assertEqual(metrics.registry.snapshot()[('tavern_test_shards_total', ())], 8000)
+
+    def test_processes_are_added_up_from_metrics_dir(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        for pid in (os.getppid(), exited.pid):
+            with open(os.path.join(directory, f'metrics-{pid}.json'), 'w') as f:
+                json.dump([['tavern_orders_created_total', [], 2], ['tavern_http_requests_in_flight', [], 3]], f)
+
+        with override_settings(METRICS_DIR=directory):
+            metrics.flush()
+            self.assertTrue(os.path.exists(os.path.join(directory, f'metrics-{os.getpid()}.json')))
+            values = metrics.collect()
+            # The exited process's counters now live in the retired file
+            self.assertFalse(os.path.exists(os.path.join(directory, f'metrics-{exited.pid}.json')))
+            self.assertTrue(os.path.exists(os.path.join(directory, metrics.RETIRED_FILE)))
+            again = metrics.collect()
+        own = metrics.registry.snapshot()
+        for totals in (values, again):
+            self.assertEqual(totals[('tavern_orders_created_total', ())],
+                             own.get(('tavern_orders_created_total', ()), 0) + 4)
+            # Only the live process's in-flight requests count
+            self.assertEqual(totals[('tavern_http_requests_in_flight', ())],
+                             own.get(('tavern_http_requests_in_flight', ()), 0) + 3)
+
+
+# =========================
+# Catalog import
+# =========================
+class CatalogImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_csv_upsert_with_batched_slugs(self):
+        wines = Category.objects.create(name='Wines', slug='wines')
+        existing = make_product('Four Cousins', slug='four-cousins', price='500.00', category=wines,
+                                size='1L', rating_sum=9, rating_count=2)
+        version = page_cache.get_catalog_version()
+        path = self.write('catalog.csv', (
+            'name,price,stock,category,subcategory,group,description\n'
+            'Four Cousins,650.00,12,wines,Red,Varieties,Sweet red\n'
+            'Red Wine,700,3,Wines,Red,Varieties,\n'
+            'Red-Wine,800,3,Spirits,Gin,,\n'
+            'No Price,,1,Wines,,,\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, '--batch-size', '2', stdout=out, stderr=err)
+
+        self.assertIn('Imported 3 products', out.getvalue())
+        self.assertIn('Line 5: price is required', err.getvalue())
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.price, existing.stock, existing.size), (Decimal('650.00'), 12, '1L'))
+        self.assertEqual(existing.rating_count, 2)  # columns not in the file are left alone
+        self.assertEqual(existing.subcategory.slug, 'red')
+        gin = Product.objects.get(slug='red-wine-2')
+        self.assertEqual((gin.category.name, gin.subcategory.name), ('Spirits', 'Gin'))
+
+        self.assertTrue(search.search_products(Product.objects.all(), 'sweet').exists())
+        self.assertNotEqual(page_cache.get_catalog_version(), version)
+
+    def test_jsonl(self):
+        path = self.write('catalog.jsonl', (
+            '{"name": "Gilbeys", "price": 1200, "feature": "popular", "slug": "gilbeys-750"}\n'
+            'not json\n'
+            '{"name": "Gilbeys", "price": 1100, "slug": "gilbeys-750"}\n'
+        ))
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+        product = Product.objects.get()
+        self.assertEqual((product.slug, product.price, product.feature), ('gilbeys-750', Decimal('1100'), None))
+
+    def test_a_different_name_never_overwrites_an_existing_product(self):
+        existing = make_product('Good1', slug='good1', price='10.00')
+        path = self.write('catalog.csv', 'name,price\nGOOD1.,99\nGood1,12\n')
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.price), ('Good1', Decimal('12.00')))
+        self.assertEqual(Product.objects.get(slug='good1-2').name, 'GOOD1.')
+
+    def test_bad_values_are_reported_not_fatal(self):
+        path = self.write('catalog.jsonl', '\n'.join([
+            '{"name": "Nan", "price": "NaN"}',
+            '{"name": "Huge", "price": 1e20}',
+            '{"name": "Listy", "price": 1, "feature": ["new"]}',
+            '{"name": "Numbered", "price": 1, "category": 7, "subcategory": 8}',
+            '{"name": "Overstocked", "price": 1, "stock": 1e12}',
+            '{"name": "Sized", "price": 1, "size": "%s"}' % ('x' * 51),
+            '{"name": "Fine", "price": "12.349"}',
+        ]) + '\n')
+        err = StringIO()
+        call_command('import_catalog', path, '--batch-size', '1', stdout=StringIO(), stderr=err)
+
+        for line in ('Line 1: price is not a number', 'Line 2: price is out of range',
+                     'Line 3: feature must be a single value', 'Line 5: stock is not a whole number',
+                     'Line 6: size is longer than 50 characters'):
+            self.assertIn(line, err.getvalue())
+        self.assertEqual(Product.objects.get(slug='numbered').category.name, '7')
+        self.assertEqual(Product.objects.get(slug='fine').price, Decimal('12.35'))
+
+    def test_index_is_rebuilt_when_an_import_is_cut_short(self):
+        def rows():
+            yield 1, {'name': 'Kenya Cane', 'price': '900'}
+            raise OSError("input went away")
+
+        with self.assertRaises(OSError):
+            CatalogImporter(batch_size=1).run(rows())
+        self.assertTrue(search.search_products(Product.objects.all(), 'cane').exists())
+
+
+# =========================
+# Order exports
+# =========================
+class OrderExportTests(TestCase):
+
+    def setUp(self):
+        customer = User.objects.create_user('ann', 'ann@example.com', 'pw')
+        gin = make_product('Gin', price='900.00')
+        self.paid = Order.objects.create(user=customer, total_amount='1800.00', status='paid', phone='0700')
+        OrderItem.objects.create(order=self.paid, product=gin, quantity=2, price='900.00')
+        self.old = Order.objects.create(total_amount='10.00', status='paid')
+        Order.objects.filter(id=self.old.id).update(created_at=timezone.now() - timedelta(days=400))
+        Order.objects.create(total_amount='5.00', status='pending')
+
+    def test_staff_only_streaming_csv(self):
+        self.assertEqual(self.client.get('/exports/orders/').status_code, 302)
+
+        self.client.force_login(User.objects.create_user('finance', password='pw', is_staff=True))
+        start = (timezone.localdate() - timedelta(days=30)).isoformat()
+        response = self.client.get('/exports/orders/', {'status': 'paid', 'start': start})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(r['order_id'], r['username'], r['product_name'], r['quantity']) for r in rows],
+                         [(str(self.paid.id), 'ann', 'Gin', '2')])
+
+        self.assertEqual(self.client.get('/exports/orders/', {'start': 'yesterday'}).status_code, 400)
+
+    async def test_asgi_gets_an_async_stream(self):
+        await Order.objects.acreate(total_amount='1.00', status='paid', first_name='=HYPERLINK("http://x")',
+                                    last_name='-2+cmd|" /C calc"!A0', phone='+254 700 000000')
+        staff = await User.objects.acreate(username='finance', is_staff=True)
+        await self.async_client.aforce_login(staff)
+        with override_settings(EXPORT_CHUNK_SIZE=1):
+            response = await self.async_client.get('/exports/orders/', {'status': 'paid'})
+            self.assertTrue(response.is_async)
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual(len(rows), 3)
+        # Spreadsheets would run these as formulas; phone numbers stay as typed
+        self.assertEqual((rows[2]['first_name'], rows[2]['last_name'], rows[2]['phone']),
+                         ('\'=HYPERLINK("http://x")', '\'-2+cmd|" /C calc"!A0', '+254 700 000000'))
+
+    def test_command_ndjson(self):
+        out = StringIO()
+        call_command('export_orders', '--format', 'ndjson', '--status', 'paid', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['order_id'] for row in rows], [self.paid.id, self.old.id])
+        self.assertEqual(rows[1]['product_name'], None)  # an order without lines still appears
+        self.assertEqual(rows[0]['unit_price'], '900.00')
+
+
+# =========================
+# Load benchmark
+# =========================
+class BenchmarkTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_every_scenario_runs_cleanly(self):
+        # Someone else's rows that happen to share the prefix
+        bystander = make_product('Bench press', slug='bench-press', image='')
+        Order.objects.create(total_amount='10.00', email='bench@example.com')
+        guest_cart = Cart.objects.create()
+
+        fixtures = benchmark.create_fixtures(products=10, categories=2)
+        report = benchmark.run(
+            list(benchmark.SCENARIOS), fixtures,
+            partial(benchmark.ClientDriver, fixtures), workers=1, iterations=1,
+        )
+        endpoints = report['endpoints']
+        self.assertEqual(sum(row['errors'] for row in endpoints.values()), 0)
+        self.assertIn('checkout', endpoints)
+        self.assertIn('track_order', endpoints)
+        self.assertGreater(endpoints['checkout']['queries_max'], 0)
+        json.dumps(report)  # diffable output
+
+        self.assertTrue(Order.objects.filter(email=fixtures['checkout_email']).exists())
+        benchmark.remove_fixtures(fixtures)
+        self.assertEqual(list(Product.objects.all()), [bystander])
+        self.assertEqual(list(Order.objects.values_list('email', flat=True)), ['bench@example.com'])
+        self.assertFalse(Category.objects.exists())
+        self.assertFalse(User.objects.exists())
+        # The guest carts and sessions the run's requests made
+        self.assertEqual(len(fixtures['created']['sessions']), 2)
+        self.assertEqual(list(Cart.objects.all()), [guest_cart])
+        self.assertFalse(Session.objects.exists())
+
+    def test_url_mode_needs_cleanup_flag(self):
+        with self.assertRaisesMessage(CommandError, '--cleanup'):
+            call_command('bench', url='http://127.0.0.1:1', stdout=StringIO())
+
+
+# =========================
+# Image renditions
+# =========================
+class ImageRenditionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, PRODUCT_IMAGE_WIDTHS=(64, 128, 480), PRODUCT_IMAGE_FORMATS=('webp',),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), 'red').save(buffer, format='WEBP')
+        self.image_name = default_storage.save('products/cake.webp', ContentFile(buffer.getvalue()))
+
+    def render(self, product):
+        return Template('{% load product_images %}{% picture product.image "64px" alt=product.name %}').render(
+            Context({'product': product})
+        )
+
+    def test_upload_schedules_renditions_and_tag_uses_them(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            product = make_product('Cake', image=self.image_name)
+        self.assertEqual(len(callbacks), 1)
+
+        # Before the worker runs, the original is served
+        self.assertNotIn('<picture>', self.render(product))
+
+        manifest = renditions.generate(self.image_name)
+        self.assertEqual(manifest, {'webp': [64, 128]})  # never upscaled past 300px
+        with default_storage.open(renditions.rendition_name(self.image_name, 128, 'webp')) as f:
+            self.assertEqual(Image.open(f).size, (128, 85))
+
+        html = self.render(product)
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('/media/renditions/products/cake-64w.webp 64w', html)
+        self.assertIn('src="/media/products/cake.webp"', html)
+
+    def test_backfill_command(self):
+        Product.objects.bulk_create([Product(name='Cake', slug='cake', price=1, image=self.image_name)])
+        call_command('build_renditions', stdout=StringIO())
+
+        cache.clear()  # the manifest is recovered from storage
+        self.assertEqual(renditions.get_manifest(self.image_name), {'webp': [64, 128]})
+
+    def test_missing_renditions_are_cached_until_generated(self):
+        self.assertEqual(renditions.get_manifest(self.image_name), {})
+        self.assertEqual(cache.get(renditions.manifest_key(self.image_name)), {})
+
+        renditions.generate(self.image_name)
+        self.assertEqual(renditions.get_manifest(self.image_name), {'webp': [64, 128]})
+
+    def test_narrow_source_is_recovered_from_storage(self):
+        buffer = BytesIO()
+        Image.new('RGB', (40, 40), 'red').save(buffer, format='WEBP')
+        image_name = default_storage.save('products/thumb.webp', ContentFile(buffer.getvalue()))
+        self.assertEqual(renditions.generate(image_name), {'webp': [40]})
+
+        cache.clear()
+        self.assertEqual(renditions.get_manifest(image_name), {'webp': [40]})
+
+    def test_new_renditions_expire_cached_pages(self):
+        version = page_cache.get_catalog_version()
+        renditions.generate(self.image_name)
+        self.assertNotEqual(page_cache.get_catalog_version(), version)
+
+        version = page_cache.get_catalog_version()
+        renditions.generate(self.image_name)  # nothing new written
+        self.assertEqual(page_cache.get_catalog_version(), version)
@@ -26,6 +26,9 @@ urlpatterns = [
          views.product_list,
          name='products_by_subcategory'),
 
+    # Infinite scroll: the next page of any of the grids above
+    path('products/more/', views.product_list_more, name='product_list_more'),
+
     # =========================
     # Cart
     # =========================
@@ -43,11 +46,14 @@ urlpatterns = [
     path("track/<int:order_id>/", views.track_order, name="track_order"),
     path("driver/<int:order_id>/", views.driver_tracking, name="driver_tracking"),
     path("driver-location/<int:order_id>/", views.driver_location),
+    path("driver-location/<int:order_id>/stream/", views.driver_location_stream, name="driver_location_stream"),
     path("update-location/<int:order_id>/", views.update_driver_location),
+    path("driver-route/<int:order_id>/", views.driver_route, name="driver_route"),
     #path('checkout/mpesa/', views.mpesa_checkout, name='mpesa_checkout'),
     path('checkout/intasend/<int:order_id>/', views.intasend_payment_view, name='intasend_payment'),
     path('intasend/webhook/', views.intasend_webhook, name='intasend_webhook'),
     path('checkout/intasend/status/<int:order_id>/', views.check_payment_status, name='check_payment_status'),
+    path('checkout/intasend/status/<int:order_id>/wait/', views.wait_payment_status, name='wait_payment_status'),
     path('checkout/payment-wait/<int:order_id>/', views.payment_wait, name='payment_wait'),
 
     # =========================
@@ -65,4 +71,14 @@ urlpatterns = [
     # Admin Reports
     # =========================
     #path('admin-reports/', views.admin_reports, name='admin_reports'),
+
+    # =========================
+    # Exports (staff)
+    # =========================
+    path('exports/orders/', views.export_orders, name='export_orders'),
+
+    # =========================
+    # Metrics
+    # =========================
+    path('metrics', views.metrics_endpoint, name='metrics'),
 ]
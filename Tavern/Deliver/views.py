@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.db.models import Sum, Count, Avg
 from django.core.mail import send_mail
@@ -10,13 +11,23 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from decimal import Decimal
 from django.db import transaction
-import requests
+import asyncio
+import time
+from asgiref.sync import sync_to_async
 import uuid
 import json
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse, JsonResponse
-from django.db.models import Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Prefetch, Q
 from django.urls import reverse
+from django.contrib.admin.views.decorators import staff_member_required
+from . import exports, geo, intasend, inventory, location_store, metrics, payment_events, recommendations, search
+from .cart_summary import get_cart_summary, invalidate_cart_summary
+from .orders import EmptyCartError, place_order
+from .page_cache import cache_anonymous_page
+from .pagination import InvalidCursor, KeysetPaginator
+from .realtime import hub, location_channel, notify_order_status, sse_stream, status_channel
 
 
 # =========================
@@ -94,13 +105,28 @@ def get_cart(request):
 # =========================
 # Product Views
 # =========================
-def product_list(request, category_slug=None, subcategory_slug=None):
+# Keyset orderings for the product grid; each ends in a unique column
+CATALOG_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'price': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+
+
+def catalog_page(request, category_slug=None, subcategory_slug=None):
+    """
+    The filters and one keyset page of the product grid, shared by the
+    full page and the infinite-scroll fragment. Raises InvalidCursor.
+    """
     products = Product.objects.all()
     category = None
     subcategory = None
     
     view_filter = request.GET.get('filter')
     search_query = request.GET.get('q')  # get search query
+    sort = request.GET.get('sort')
+    if sort not in CATALOG_ORDERINGS:
+        sort = 'newest'
 
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
@@ -110,54 +136,84 @@ def product_list(request, category_slug=None, subcategory_slug=None):
         subcategory = get_object_or_404(SubCategory, slug=subcategory_slug)
         products = products.filter(subcategory=subcategory)
 
-    # Search filtering
+    ordering = CATALOG_ORDERINGS[sort]
+
+    # Search filtering (ranked, prefix-matching full-text index)
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        products = search.search_products(products, search_query)
+        if 'search_rank' in products.query.annotations:
+            # Best matches first; the backend already caps the match count
+            ordering = ('search_rank', 'id')
+    elif not category and not subcategory and view_filter == 'popular':
+        products = products.filter(feature='popular')
+
+    paginator = KeysetPaginator(
+        products,
+        ordering=ordering,
+        page_size=getattr(settings, 'CATALOG_PAGE_SIZE', 24),
+    )
+    return {
+        'products': paginator.page(request.GET.get('cursor')),
+        'category': category,
+        'subcategory': subcategory,
+        'view_filter': view_filter,
+        'search_query': search_query,
+        'sort': sort,
+    }
+
+
+@cache_anonymous_page(query_params=('filter', 'q', 'sort', 'cursor'))
+def product_list(request, category_slug=None, subcategory_slug=None):
+    try:
+        context = catalog_page(request, category_slug, subcategory_slug)
+    except InvalidCursor:
+        return redirect(request.path)
 
     popular_products = None
     new_products = None
 
-    if not category and not subcategory and not search_query:
-        if view_filter == 'popular':
-            popular_products = Product.objects.filter(feature='popular')
-            new_products = None
-            products = None
-        else:
+    if not category_slug and not subcategory_slug and not context['search_query']:
+        if context['view_filter'] != 'popular':
             popular_products = Product.objects.filter(feature='popular')[:6]
             new_products = Product.objects.filter(feature='new').order_by('-created_at')[:6]
 
-    context = {
-        'products': products,
-        'category': category,
-        'subcategory': subcategory,
+    context.update({
         'popular_products': popular_products,
         'new_products': new_products,
-        'view_filter': view_filter,
-        'search_query': search_query,
-    }
+    })
 
     return render(request, 'Deliver/product_list.html', context)
 
+
+def product_list_more(request):
+    """
+    Next page of the product grid as rendered cards, for infinite scroll.
+    Not page-cached: the cards carry this visitor's CSRF token.
+    """
+    try:
+        context = catalog_page(request, request.GET.get('category'), request.GET.get('subcategory'))
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+
+    products = context['products']
+    return JsonResponse({
+        'html': render_to_string('Deliver/product_cards.html', {'products': products}, request=request),
+        'next_cursor': products.next_cursor,
+    })
+
+@cache_anonymous_page()
 def product_detail(request, slug):
     # Fetch the product or return 404 if not found
     product = get_object_or_404(Product, slug=slug)
     
-    # Optional: Get related products from the same subcategory/category
-    # This is great for a "You may also like" section later
-    related_products = Product.objects.filter(
-        subcategory=product.subcategory
-    ).exclude(id=product.id)[:4]
+    # Most often bought together, falling back to the same subcategory
+    related_products = recommendations.related_products(product, limit=4)
 
     # Fetch ratings for this specific product
     ratings = product.ratings.all().order_by('-created_at')
-    
-    # Calculate average rating (optional logic)
-    avg_rating = 0
-    if ratings.exists():
-        avg_rating = sum(r.rating for r in ratings) / ratings.count()
+
+    # Stored on the product, so no aggregate query is needed
+    avg_rating = product.average_rating
 
     context = {
         'product': product,
@@ -179,6 +235,7 @@ def add_to_cart(request, slug):
     if not created:
         cart_item.quantity += 1
         cart_item.save()
+    invalidate_cart_summary(cart.id)
 
     messages.success(request, f"{product.name} added to cart.")
     return redirect('cart')
@@ -186,26 +243,17 @@ def add_to_cart(request, slug):
 
 def view_cart(request):
     cart = get_cart(request)
-    items = cart.items.all()
-
-    total = sum(Decimal(item.total_price()) for item in items)
-    vat_rate = Decimal('0.16')
-    delivery_threshold = Decimal('15000')
-
-    subtotal_ex_vat = (total / (Decimal('1') + vat_rate)) if total > 0 else Decimal('0')
-    vat_amount = total - subtotal_ex_vat
-
-    progress_percent = (total / delivery_threshold * Decimal('100')) if total > 0 else Decimal('0')
-    progress_percent = min(progress_percent, Decimal('100'))
+    items = cart.items.select_related('product')
+    summary = get_cart_summary(cart.id)
 
     context = {
         'cart': cart,
         'items': items,
-        'total': total,
-        'subtotal_ex_vat': subtotal_ex_vat,
-        'vat_amount': vat_amount,
-        'progress_percent': progress_percent,
-        'delivery_threshold': delivery_threshold,
+        'total': summary['total'],
+        'subtotal_ex_vat': summary['subtotal_ex_vat'],
+        'vat_amount': summary['vat_amount'],
+        'progress_percent': summary['progress_percent'],
+        'delivery_threshold': summary['delivery_threshold'],
     }
 
     return render(request, 'Deliver/cart.html', context)
@@ -229,6 +277,7 @@ def update_cart_quantity(request, slug):
             else:
                 cart_item.delete()
                 messages.success(request, f'{cart_item.product.name} removed from cart.')
+        invalidate_cart_summary(cart.id)
 
     return redirect('cart')
 
@@ -238,6 +287,7 @@ def remove_from_cart(request, slug):
         cart = get_cart(request)
         cart_item = get_object_or_404(CartItem, cart=cart, product__slug=slug)
         cart_item.delete()
+        invalidate_cart_summary(cart.id)
         messages.success(request, f'{cart_item.product.name} removed from cart.')
 
     return redirect('cart')
@@ -249,16 +299,16 @@ def remove_from_cart(request, slug):
 # views.py
 def checkout(request):
     cart = get_cart(request)
-    items = cart.items.all()
+    items = cart.items.select_related('product')
+    summary = get_cart_summary(cart.id)
 
-    if not items.exists():
+    if not summary['line_count']:
         messages.warning(request, "Your cart is empty.")
         return redirect('product_list')
 
-    total = sum(Decimal(item.total_price()) for item in items)
-    vat_rate = Decimal('0.16')
-    subtotal_ex_vat = total / (Decimal('1') + vat_rate)
-    vat_amount = total - subtotal_ex_vat
+    total = summary['total']
+    subtotal_ex_vat = summary['subtotal_ex_vat']
+    vat_amount = summary['vat_amount']
 
     if request.method == 'POST':
         # Collect user info
@@ -275,9 +325,11 @@ def checkout(request):
 
         payment_method = request.POST.get('payment')
 
-        with transaction.atomic():
-            order = Order.objects.create(
+        try:
+            order = place_order(
+                cart,
                 user=request.user if request.user.is_authenticated else None,
+                pay_online=payment_method == 'intasend',
                 first_name=first_name,
                 last_name=last_name,
                 phone=phone,
@@ -287,23 +339,24 @@ def checkout(request):
                 door_number=door_number,
                 latitude=latitude,
                 longitude=longitude,
-                total_amount=total,
-                status='pending'
             )
-
-            for item in items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.product,
-                    quantity=item.quantity,
-                    price=item.product.price
-                )
-
-            # Clear guest session cart
-            if not request.user.is_authenticated:
-                del request.session['cart_id']
-
-            items.delete()
+        except EmptyCartError:
+            invalidate_cart_summary(cart.id)
+            messages.warning(request, "Your cart is empty.")
+            return redirect('product_list')
+        except inventory.OutOfStockError as e:
+            for product in e.products:
+                if product.stock:
+                    messages.error(request, f"Only {product.stock} {product.name} left in stock.")
+                else:
+                    messages.error(request, f"{product.name} is out of stock.")
+            return redirect('cart')
+
+        # Clear guest session cart
+        if not request.user.is_authenticated:
+            del request.session['cart_id']
+
+        invalidate_cart_summary(cart.id)
 
         # Redirect to IntaSend payment page if chosen
         if payment_method == 'intasend':
@@ -325,14 +378,18 @@ def checkout(request):
 
 #
 
-def intasend_payment_view(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+async def intasend_payment_view(request, order_id):
+    """
+    Async so that, under ASGI, waiting on the gateway for an STK push holds
+    no worker thread; the ORM and templates still run through sync_to_async.
+    """
+    order = await sync_to_async(get_object_or_404)(Order, id=order_id)
 
     # =========================
     # Development: Simulate Payment
     # =========================
     if settings.DEBUG:
-        simulate_payment(order)
+        await sync_to_async(simulate_payment)(order)
         messages.success(request, "Payment simulated successfully (DEV MODE).")
         return redirect("payment_wait", order_id=order.id)
 
@@ -345,48 +402,82 @@ def intasend_payment_view(request, order_id):
             messages.error(request, "Phone number is required to initiate payment.")
             return redirect("intasend_payment", order_id=order.id)
 
-        payload = {
-            "amount": float(order.total_amount),
-            "phone_number": phone,
-            "currency": "KES",
-            "api_ref": f"ORDER-{order.id}", 
-            "callback_url": request.build_absolute_uri("/intasend/webhook/"),
-        }
-
-        headers = {
-            "Authorization": f"Bearer {settings.INTASEND_SECRET_KEY}",
-            "Content-Type": "application/json"
-        }
-
         try:
-            response = requests.post(
-                "https://sandbox.intasend.com/api/v1/payment/mpesa-stk-push/",
-                json=payload,
-                headers=headers,
-                timeout=15
+            # Pooled, retrying client with a circuit breaker (Deliver.intasend)
+            result = await intasend.get_client().astk_push(
+                amount=order.total_amount,
+                phone_number=phone,
+                api_ref=f"ORDER-{order.id}",
+                callback_url=request.build_absolute_uri("/intasend/webhook/"),
             )
-            print(f"Status Code: {response.status_code}")
-            data = response.json()
 
-            if response.status_code in [200, 201, 202]:
-                order.status = "payment_initiated"
-                order.save()
+            if result.ok:
+                await sync_to_async(mark_payment_initiated)(order)
                 messages.info(request, "Please check your phone for the M-Pesa STK prompt.")
                 return redirect("payment_wait", order_id=order.id)
             else:
-                error_msg = data.get("errors", "Request failed. Verify your phone number.")
-                messages.error(request, f"Payment error: {error_msg}")
+                messages.error(request, f"Payment error: {result.error}")
                 return redirect("intasend_payment", order_id=order.id)
 
-        except requests.RequestException as e:
+        except intasend.IntaSendError as e:
             messages.error(request, f"Connection to payment gateway failed: {str(e)}")
             return redirect("intasend_payment", order_id=order.id)
 
-    return render(request, "Deliver/mpesa_checkout.html", {"order": order})
+    return await sync_to_async(render)(request, "Deliver/mpesa_checkout.html", {"order": order})
+
+def mark_payment_initiated(order):
+    # Conditional, like payment_events: the callback may already have been applied
+    if Order.objects.filter(id=order.id, status__in=('pending', 'payment_failed')).update(
+            status='payment_initiated'):
+        notify_order_status(order.id, 'payment_initiated')
 
 def check_payment_status(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    return JsonResponse({"status": order.status})
+    # Only the status column, not the whole order row
+    status = Order.objects.filter(id=order_id).values_list('status', flat=True).first()
+    if status is None:
+        raise Http404("No such order.")
+    return JsonResponse({"status": status})
+
+async def wait_payment_status(request, order_id):
+    """
+    Long-poll: answer as soon as the order's status differs from `?status=`,
+    or with the unchanged status once the timeout elapses. Waiters are woken
+    in-process by notify_order_status, and re-read the database every
+    PAYMENT_STATUS_RECHECK seconds for changes made by other workers.
+    Needs ASGI: under WSGI a waiter would hold a worker, so we answer at once.
+    """
+    known = request.GET.get('status')
+    try:
+        timeout = min(float(request.GET.get('timeout', settings.PAYMENT_STATUS_WAIT_TIMEOUT)),
+                      settings.PAYMENT_STATUS_WAIT_TIMEOUT)
+    except ValueError:
+        return JsonResponse({"error": "timeout must be a number"}, status=400)
+    if not isinstance(request, ASGIRequest):
+        timeout = 0
+
+    orders = Order.objects.filter(id=order_id).values_list('status', flat=True)
+    # Subscribe before reading so a change in between is not missed
+    subscription = hub.subscribe(status_channel(order_id))
+    try:
+        status = await orders.afirst()
+        if status is None:
+            raise Http404("No such order.")
+        deadline = time.monotonic() + timeout
+        while status == known:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                status = (await subscription.get(min(remaining, settings.PAYMENT_STATUS_RECHECK)))['status']
+            except asyncio.TimeoutError:
+                status = await orders.afirst() or status
+    finally:
+        hub.unsubscribe(subscription)
+
+    response = JsonResponse({"status": status})
+    if not timeout:
+        response['Retry-After'] = settings.PAYMENT_STATUS_RECHECK  # nothing was held; poll instead
+    return response
     
 def payment_wait(request, order_id):
     order = get_object_or_404(Order, id=order_id)
@@ -397,25 +488,16 @@ def intasend_webhook(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            # IntaSend usually sends 'invoice_id' or 'api_ref'
-            reference = data.get('api_ref') 
-            state = data.get('state') # IntaSend often uses 'state': 'COMPLETE'
-
-            if reference and reference.startswith("ORDER-"):
-                order_id = int(reference.split('-')[1])
-                order = Order.objects.get(id=order_id)
-
-                if state == 'COMPLETE':
-                    order.status = 'paid'
-                elif state == 'FAILED':
-                    order.status = 'payment_failed'
-                order.save()
-            
-            return HttpResponse(status=200) # Tell IntaSend "Got it!"
-        except Exception as e:
-            print(f"Webhook error: {e}")
-            return HttpResponse(status=400) # Something went wrong
-            
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return HttpResponse(status=400) # Malformed; a retry won't fix it
+
+        # Only queue the event here; Deliver.payment_events applies it to the
+        # order. Retried deliveries are deduplicated, so always acknowledge.
+        payment_events.record_event(data)
+        return HttpResponse(status=200) # Tell IntaSend "Got it!"
+
     return HttpResponse(status=405) # Method not allowed
 
 def order_history(request):
@@ -432,14 +514,31 @@ def order_history(request):
         user_orders = user_orders | guest_orders
         del request.session['cart_id']
 
-    orders = user_orders.order_by('-created_at')
+    # Keyset pagination: newest first, one page of orders per request
+    paginator = KeysetPaginator(
+        user_orders.prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        ),
+        ordering=('-created_at', '-id'),
+        page_size=getattr(settings, 'ORDER_HISTORY_PAGE_SIZE', 20),
+    )
+    try:
+        orders = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return redirect('orders')
 
-    # Annotate each order item with a flag if the user has already rated it
+    # One query for everything on this page the user has already rated
+    product_ids = {item.product_id for order in orders for item in order.items.all()}
+    rated_ids = set(
+        ProductRating.objects.filter(user=request.user, product_id__in=product_ids)
+        .values_list('product_id', flat=True)
+    )
     for order in orders:
         for item in order.items.all():
-            item.rated_by_user = item.product.ratings.filter(user=request.user).exists()
+            item.rated_by_user = item.product_id in rated_ids
 
     return render(request, 'Deliver/orders.html', {'orders': orders})
+
 # =========================
 # Ratings (logged in only)
 # =========================
@@ -455,21 +554,25 @@ def rate_product(request, pk):
         rating = int(request.POST.get('rating'))
         comment = request.POST.get('comment', '')
 
-        # Check if user has already rated
-        existing_rating = ProductRating.objects.filter(product=product, user=request.user).first()
-        if existing_rating:
-            existing_rating.rating = rating
-            existing_rating.comment = comment
-            existing_rating.save()
-            messages.success(request, f"Updated your rating for {product.name}.")
-        else:
-            ProductRating.objects.create(
-                product=product,
-                user=request.user,
-                rating=rating,
-                comment=comment
-            )
-            messages.success(request, f"Thank you for rating {product.name}!")
+        # Check if user has already rated. The rating row and the product's
+        # stored aggregates are written in the same transaction.
+        with transaction.atomic():
+            existing_rating = ProductRating.objects.select_for_update().filter(
+                product=product, user=request.user
+            ).first()
+            if existing_rating:
+                existing_rating.rating = rating
+                existing_rating.comment = comment
+                existing_rating.save()
+                messages.success(request, f"Updated your rating for {product.name}.")
+            else:
+                ProductRating.objects.create(
+                    product=product,
+                    user=request.user,
+                    rating=rating,
+                    comment=comment
+                )
+                messages.success(request, f"Thank you for rating {product.name}!")
 
         # Redirect back to where the request came from (orders page or product page)
         return redirect(request.META.get('HTTP_REFERER', 'orders'))
@@ -522,9 +625,12 @@ def simulate_payment(order):
     """
     Marks an order as paid for development purposes without calling IntaSend.
     """
+    if order.status != "paid":
+        inventory.commit(order.id)
     order.status = "paid"
     order.payment_reference = f"FAKE-{order.id}"  # fake payment reference
     order.save()
+    notify_order_status(order.id, order.status)
     print(f"[SIMULATION] Order {order.id} marked as PAID.")
 
 
@@ -533,6 +639,8 @@ def track_order(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
 
     tracking = OrderTracking.objects.filter(order=order).first()
+    if tracking:
+        location_store.overlay(tracking)
 
     return render(request, "Deliver/track_order.html", {
         "order": order,
@@ -541,12 +649,69 @@ def track_order(request, order_id):
 
 def driver_location(request, order_id):
 
-    tracking = get_object_or_404(OrderTracking, order_id=order_id)
+    # Served from the hot location store, not a database read per poll
+    entry = location_store.get_location(order_id)
+    if entry is None:
+        raise Http404("No tracking for this order.")
+
+    return JsonResponse(location_store.as_payload(entry))
+
+async def driver_location_stream(request, order_id):
+    """
+    Server-Sent Events feed of the driver's position for one order. A frame is
+    pushed only when update_driver_location changes something.
+    Needs ASGI: under WSGI the stream could never be flushed, so we answer 204
+    and the page falls back to polling driver_location.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    if not await Order.objects.filter(id=order_id, user_id=user.id).aexists():
+        raise Http404("No such order.")
+
+    async def current():
+        entry = await sync_to_async(location_store.get_location)(order_id)
+        return location_store.as_payload(entry) if entry else None
+
+    async def events():
+        # Subscribe before reading the snapshot so no update slips in between
+        subscription = hub.subscribe(location_channel(order_id))
+        initial = await current()
+        # Pings handled by other workers only reach this one through the store
+        refresh_every = settings.DRIVER_LOCATION_STREAM_REFRESH
+        async for frame in sse_stream(subscription, initial, refresh=current, refresh_every=refresh_every):
+            yield frame
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
+
+def driver_route(request, order_id):
+    """
+    The route driven so far as a simplified polyline. `bucket` (seconds) keeps
+    one point per time window, `tolerance` (metres) runs Douglas-Peucker.
+    """
+    if not request.user.is_authenticated:
+        raise Http404("No such order.")
+    orders = Order.objects.all() if request.user.is_staff else Order.objects.filter(user=request.user)
+    order = get_object_or_404(orders, id=order_id)
+
+    try:
+        tolerance = float(request.GET.get('tolerance', settings.DRIVER_ROUTE_TOLERANCE))
+        bucket = int(request.GET.get('bucket', 0))
+    except ValueError:
+        return JsonResponse({"error": "tolerance and bucket must be numbers"}, status=400)
+
+    raw = location_store.route_points(order.id)
+    points = geo.douglas_peucker(geo.time_bucket(raw, bucket), tolerance)
 
     return JsonResponse({
-        "lat": float(tracking.driver_latitude) if tracking.driver_latitude else 0,
-        "lng": float(tracking.driver_longitude) if tracking.driver_longitude else 0,
-        "status": tracking.status
+        "points": [[lat / geo.SCALE, lng / geo.SCALE] for _, lat, lng in points],
+        "polyline": geo.encode_polyline(points),
+        "raw_count": len(raw),
+        "distance_m": round(geo.path_length_m(raw)),
     })
 
 def driver_tracking(request, order_id):
@@ -565,10 +730,60 @@ def update_driver_location(request, order_id):
         lng = data.get("longitude")
         status = data.get("status", "on_the_way")
 
-        tracking = OrderTracking.objects.get(order_id=order_id)
-        tracking.driver_latitude = lat
-        tracking.driver_longitude = lng
-        tracking.status = status
-        tracking.save()
+        # Pings land in the hot store; OrderTracking is written behind it.
+        # Stationary drivers resend the same fix, and only real changes
+        # are pushed to the watchers of this order.
+        metrics.DRIVER_PINGS.inc()
+        entry, changed = location_store.record_ping(order_id, lat, lng, status)
+        if entry is None:
+            raise Http404("No such order.")
+        if changed:
+            hub.publish(location_channel(order_id), location_store.as_payload(entry))
+
+        return JsonResponse({"status": "updated"})
 
-        return JsonResponse({"status": "updated"})
\ No newline at end of file
+
+# =========================
+# Order exports
+# =========================
+@staff_member_required
+def export_orders(request):
+    """
+    Orders with their lines and customer details, streamed as CSV or
+    NDJSON (?format=), filtered by ?start= / ?end= (YYYY-MM-DD, inclusive)
+    and any number of ?status=.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return JsonResponse({"error": "format must be csv or ndjson"}, status=400)
+    try:
+        start = exports.parse_date(request.GET.get('start'))
+        end = exports.parse_date(request.GET.get('end'))
+    except ValueError:
+        return JsonResponse({"error": "start and end must be YYYY-MM-DD"}, status=400)
+
+    content_type, extension = exports.FORMATS[fmt]
+    rows = exports.order_rows(start, end, request.GET.getlist('status'))
+    lines = exports.lines(fmt, rows)
+    if isinstance(request, ASGIRequest):
+        lines = exports.achunks(lines)
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="orders-{timezone.localdate():%Y%m%d}.{extension}"'
+    return response
+
+
+# =========================
+# Metrics
+# =========================
+def metrics_endpoint(request):
+    """
+    Prometheus scrape target. With METRICS_TOKEN set, the scraper must send
+    it as a bearer token; without one, only signed-in staff may look.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponse(status=401)
+    elif not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
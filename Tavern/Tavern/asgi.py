@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Live order tracking (Server-Sent Events) needs this entry point, e.g.
+    uvicorn Tavern.asgi:application
 """
 
 import os
@@ -42,6 +42,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Deliver.metrics.MetricsMiddleware',
+    'Deliver.profiling.ProfilerMiddleware',
+    'Deliver.query_stats.QueryStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -63,6 +66,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'Deliver.context_processors.categories_processor',
+                'Deliver.context_processors.cart_total_processor',
             ],
         },
     },
@@ -74,13 +78,158 @@ WSGI_APPLICATION = 'Tavern.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite unless POSTGRES_DB is set. Compare the two under concurrent writes
+# with 'manage.py bench_db_writes'.
+
+SQLITE_OPTIONS = {
+    # WAL lets reads carry on during a write; NORMAL sync is safe in WAL
+    # mode (a power cut can only lose the last commits, never corrupt).
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=134217728;'
+        'PRAGMA cache_size=-20000;'
+    ),
+    # Seconds a writer waits for the lock (busy_timeout)
+    'timeout': 20,
+    # Take the write lock at BEGIN, so a transaction that reads and then
+    # writes never fails on the lock upgrade halfway through.
+    'transaction_mode': 'IMMEDIATE',
+}
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', ''),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Check a reused connection before handing it to a request
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('POSTGRES_POOL_SIZE'):
+        # psycopg 3 connection pool (pip install "psycopg[pool]"), shared by the
+        # worker threads of a process; also covers ASGI, where persistent
+        # connections are not reused between requests.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': 2,
+                'max_size': int(os.environ['POSTGRES_POOL_SIZE']),
+                'timeout': 10,
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = 60
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': SQLITE_OPTIONS,
+        }
+    }
+
+
+# Cache
+# Local memory is per process; set REDIS_URL so cache invalidation
+# (menu versions, cart summaries, ...) reaches every worker process.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tavern',
+        }
     }
+
+NAV_CACHE_TIMEOUT = 60 * 60 * 24  # the menu is invalidated by version bumps, not expiry
+CART_SUMMARY_TIMEOUT = 60 * 60  # summaries are invalidated whenever a cart changes
+PAGE_CACHE_TIMEOUT = 60 * 15  # anonymous catalog pages; catalog edits invalidate them at once
+
+ORDER_HISTORY_PAGE_SIZE = 20
+CATALOG_PAGE_SIZE = 24  # product grid cards per page / infinite-scroll fetch
+# Co-purchase neighbours kept per product; paid orders update them as they
+# arrive, 'manage.py rebuild_recommendations' recomputes them exactly.
+RELATED_PRODUCTS_STORED = 20
+# Stock held for an unpaid order; run 'manage.py release_expired_reservations'
+# (e.g. every minute) to return lapsed holds.
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Driver pings are absorbed by the cache; OrderTracking is written at most
+# once per interval (seconds), or immediately when the delivery status changes.
+# That write-behind needs a cache shared by all processes (REDIS_URL, with an
+# eviction policy that spares keys with a TTL, e.g. volatile-lru); with the
+# per-process LocMem cache each changed position is written through instead
+# (the route is still buffered and written in chunks).
+# DRIVER_LOCATION_WRITE_BEHIND = True/False overrides the detection.
+DRIVER_LOCATION_FLUSH_INTERVAL = 30
+DRIVER_LOCATION_TTL = 60 * 60 * 6
+# Seconds between re-reads of the position by a quiet SSE stream; catches
+# pings received by other worker processes, which the in-process hub misses.
+DRIVER_LOCATION_STREAM_REFRESH = 5
+
+# Route history: pings buffered per flush, metres dropped when storing a
+# chunk, and the default simplification of the driver_route endpoint.
+DRIVER_TRACK_MAX_BUFFER = 500
+DRIVER_TRACK_STORE_TOLERANCE = 2
+DRIVER_ROUTE_TOLERANCE = 15
+
+# Longest a payment-status long-poll is held open (seconds)
+PAYMENT_STATUS_WAIT_TIMEOUT = 25
+# Seconds between database re-reads by a waiting long-poll; catches payments
+# applied by other worker processes, which the in-process hub misses.
+PAYMENT_STATUS_RECHECK = 3
+
+# Rows fetched per round trip by the streaming order exports
+# (/exports/orders/ and 'manage.py export_orders')
+EXPORT_CHUNK_SIZE = 2000
+
+# Per-view query limits (keyed by URL name, or the view's dotted path for
+# unnamed routes; '*' covers every other view);
+# going over logs a warning on 'Deliver.query_stats' with the most
+# repeated statements. Every request also logs its counts at INFO.
+QUERY_BUDGETS = {
+    '*': {'queries': 30, 'db_ms': 200},
+    'product_list': {'queries': 8},
+    'product_detail': {'queries': 10},
+    'cart': {'queries': 12},
+    'orders': {'queries': 10},
+    'Deliver.views.update_driver_location': {'queries': 8},  # most pings only touch the cache
 }
 
+# Request profiling (listed under Request profiles in the admin): 1 in
+# PROFILE_SAMPLE_RATE requests (0 = off), requests carrying a signed
+# PROFILE_HEADER ('manage.py profiling_token'), or all of them while the
+# admin toggle is on (kept in the cache: it covers every worker process only
+# with a shared cache, see REDIS_URL). PROFILER is 'cprofile' (pstats dumps) or 'sampler'
+# (collapsed stacks for flame graphs, lower overhead).
+PROFILE_SAMPLE_RATE = 0
+PROFILER = 'cprofile'
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_HEADER = 'X-Profile'
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_TOGGLE_MINUTES = 10
+PROFILE_KEEP = 500
+
+# Prometheus metrics at /metrics. Under several worker processes (gunicorn,
+# uvicorn --workers) set METRICS_DIR to a directory they share, so each
+# scrape reports totals across processes. METRICS_TOKEN, if set, must be
+# sent by the scraper as a bearer token; if not, only staff can read /metrics.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -119,6 +268,14 @@ USE_TZ = True
 STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Resized copies of product images, built in the background on upload
+# (backfill with 'manage.py build_renditions'). AVIF is skipped when the
+# installed Pillow cannot write it.
+PRODUCT_IMAGE_WIDTHS = (64, 128, 240, 480, 960)
+PRODUCT_IMAGE_FORMATS = ('avif', 'webp')
+RENDITION_WORKERS = 2
+# Seconds an image with no renditions yet is remembered as such
+RENDITION_MISSING_TIMEOUT = 60
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -130,4 +287,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 INTASEND_PUBLIC_KEY = "ISPubKey_test_ed5728d6-4d41-4e5e-bffe-9b53395faa5c"
 INTASEND_SECRET_KEY = "ISSecretKey_test_4ca51a6b-e866-42be-a53a-21b89df2d055"
 INTASEND_TEST_MODE = True  # Change to False in production
+INTASEND_API_URL = "https://sandbox.intasend.com/api/v1/"
+INTASEND_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+INTASEND_RETRIES = 2  # connection errors and 503 only
+INTASEND_MAX_RETRY_AFTER = 3  # cap on a 503's Retry-After, in seconds
+INTASEND_ASYNC_WORKERS = 10  # threads running STK pushes for async views
+INTASEND_BREAKER_THRESHOLD = 5  # consecutive failures before failing fast
+INTASEND_BREAKER_RESET = 30  # seconds before a trial request is let through
+
+# Webhook callbacks are queued as PaymentEvent rows. The inline worker thread
+# applies them in the web process; turn it off when running
+# 'manage.py process_payment_events' as a separate worker.
+PAYMENT_EVENTS_INLINE_WORKER = True
+PAYMENT_EVENTS_BATCH_SIZE = 100
 INTASEND_WEBHOOK_URL = "https://progressional-priggishly-marjory.ngrok-free.dev/intasend/webhook/"
\ No newline at end of file